@@ -1,13 +1,31 @@
 import os
-from flask import Flask, request, send_file, jsonify
+import re
+import json
+import multiprocessing
+from flask import Flask, Response, g, request, send_file, jsonify, url_for, stream_with_context
 from werkzeug.utils import secure_filename
 import tempfile
 from dotenv import load_dotenv
-from preprocessing import ImagePreprocessor
+from preprocessing import ImageTooLargeError, configure_resource_limits
+from page_worker import init_page_worker, process_blob, process_image
+from wand.exceptions import ResourceLimitError
+from pipeline import PRESETS, Plan, PipelineError, compile_request
+from cache import PageCache, ResultCache, sha256_bytes, sha256_file
+from jobs import COMPLETED, JobRunner, JobStore
+from containers import PdfWriter, append_tiff_pages
+import metrics
+from scheduling import available_cpus, split_cores
 import pdf2image
 import shutil
 import zipfile
 import io
+import time
+import base64
+import itertools
+import threading
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 
 # Load environment variables
 load_dotenv()
@@ -19,383 +37,957 @@ app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max upload size
 TEMP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'temp')
 os.makedirs(TEMP_DIR, exist_ok=True)
 
+# PDF rasterization settings
+PDF_DPI = int(os.environ.get('PDF_DPI', 300))
+# Number of pages rasterized per poppler call; peak memory is bounded by this window
+PDF_PAGE_WINDOW = max(1, int(os.environ.get('PDF_PAGE_WINDOW', 1)))
+
+# Cores available to the service (CPU affinity capped by the cgroup quota) and the
+# number of gunicorn workers sharing them (gunicorn reads the same variable)
+CPU_CORES = int(os.environ.get('CPU_CORES', 0)) or available_cpus()
+WEB_CONCURRENCY = max(1, int(os.environ.get('WEB_CONCURRENCY', 1)))
+
+# Per-page parallelism for PDFs: size of the shared process pool (1 disables it);
+# by default each gunicorn worker gets its share of the cores
+PAGE_WORKERS = max(1, int(os.environ.get('PAGE_WORKERS', 0)) or split_cores(CPU_CORES, WEB_CONCURRENCY))
+# Maximum number of pages a single request may have in flight at once
+PAGE_CONCURRENCY = max(1, int(os.environ.get('PAGE_CONCURRENCY', 4)))
+
+# Content-addressed cache of processed results, shared by all workers on the host
+RESULT_CACHE_DIR = os.environ.get('RESULT_CACHE_DIR', os.path.join(TEMP_DIR, 'cache', 'results'))
+RESULT_CACHE_MAX_BYTES = int(os.environ.get('RESULT_CACHE_MAX_BYTES', 512 * 1024 * 1024))  # 0 disables
+RESULT_CACHE_TTL = int(os.environ.get('RESULT_CACHE_TTL', 24 * 60 * 60))
+result_cache = ResultCache(RESULT_CACHE_DIR, RESULT_CACHE_MAX_BYTES, RESULT_CACHE_TTL, name='results')
+
+# Cache of rasterized PDF pages, so several pipelines over one document rasterize it once
+PAGE_CACHE_DIR = os.environ.get('PAGE_CACHE_DIR', os.path.join(TEMP_DIR, 'cache', 'pages'))
+PAGE_CACHE_MAX_BYTES = int(os.environ.get('PAGE_CACHE_MAX_BYTES', 2 * 1024 * 1024 * 1024))  # 0 disables
+PAGE_CACHE_TTL = int(os.environ.get('PAGE_CACHE_TTL', 60 * 60))
+page_cache = PageCache(PAGE_CACHE_DIR, PAGE_CACHE_MAX_BYTES, PAGE_CACHE_TTL, name='pages')
+
+# Batch requests: upper bounds on item count and total decompressed input size
+MAX_BATCH_ITEMS = int(os.environ.get('MAX_BATCH_ITEMS', 100))
+MAX_BATCH_BYTES = int(os.environ.get('MAX_BATCH_BYTES', 256 * 1024 * 1024))
+
+# Asynchronous jobs: a durable SQLite queue drained by local worker threads
+JOBS_DIR = os.environ.get('JOBS_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'jobs'))
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 1))  # 0 queues jobs without running them here
+JOB_RETENTION = int(os.environ.get('JOB_RETENTION', 24 * 60 * 60))
+os.makedirs(JOBS_DIR, exist_ok=True)
+job_store = JobStore(os.path.join(JOBS_DIR, 'jobs.sqlite3'))
+
+# Disk usage of request files and caches, measured on each /metrics scrape
+temp_dir_usage = metrics.DirectoryUsageCollector('preprocess_temp_dir_bytes',
+                                                 'Bytes on disk under the temp directory, including caches',
+                                                 TEMP_DIR)
+
+# ImageMagick resource limits, enforced per process (each page pool process has its own);
+# 0 keeps ImageMagick's default
+IMAGE_MEMORY_LIMIT = int(os.environ.get('IMAGE_MEMORY_LIMIT', 256 * 1024 * 1024))
+IMAGE_MAP_LIMIT = int(os.environ.get('IMAGE_MAP_LIMIT', 512 * 1024 * 1024))
+IMAGE_DISK_LIMIT = int(os.environ.get('IMAGE_DISK_LIMIT', 2 * 1024 * 1024 * 1024))
+IMAGE_AREA_LIMIT = int(os.environ.get('IMAGE_AREA_LIMIT', 64 * 1000 * 1000))
+IMAGE_MAX_WIDTH = int(os.environ.get('IMAGE_MAX_WIDTH', 20000))
+IMAGE_MAX_HEIGHT = int(os.environ.get('IMAGE_MAX_HEIGHT', 20000))
+IMAGE_MAX_PIXELS = int(os.environ.get('IMAGE_MAX_PIXELS', 150 * 1000 * 1000))
+# OpenMP threads per ImageMagick operation, split so that request-level and intra-op
+# parallelism together do not oversubscribe the cores (0 = automatic split).
+# A gunicorn worker processing a single image gets its share of the host; each
+# page pool process gets its share of the worker's.
+MAGICK_THREAD_LIMIT = int(os.environ.get('MAGICK_THREAD_LIMIT', 0)) or split_cores(CPU_CORES, WEB_CONCURRENCY)
+PAGE_MAGICK_THREADS = (int(os.environ.get('PAGE_MAGICK_THREADS', 0))
+                       or split_cores(CPU_CORES, WEB_CONCURRENCY * PAGE_WORKERS))
+RESOURCE_LIMITS = dict(memory=IMAGE_MEMORY_LIMIT, map=IMAGE_MAP_LIMIT, disk=IMAGE_DISK_LIMIT,
+                       area=IMAGE_AREA_LIMIT, width=IMAGE_MAX_WIDTH, height=IMAGE_MAX_HEIGHT,
+                       max_pixels=IMAGE_MAX_PIXELS)
+configure_resource_limits(thread=MAGICK_THREAD_LIMIT, **RESOURCE_LIMITS)
+
+_page_executor = None
+_page_executor_lock = threading.Lock()
+
+def get_page_executor():
+    """Return the shared process pool for per-page work, or None when disabled"""
+    global _page_executor
+    with _page_executor_lock:
+        if _page_executor is None and PAGE_WORKERS > 1:
+            # Created lazily so each gunicorn worker gets its own pool. By then the worker
+            # runs job threads and has used ImageMagick/OpenMP, so pool processes are
+            # started from a clean forkserver rather than forked with that state held.
+            # The forkserver preloads only page_worker, never this module, so the limits
+            # set by the initializer are the ones pool processes keep.
+            context = multiprocessing.get_context('forkserver')
+            context.set_forkserver_preload(['page_worker'])
+            _page_executor = ProcessPoolExecutor(max_workers=PAGE_WORKERS, mp_context=context,
+                                                 initializer=init_page_worker,
+                                                 initargs=(dict(RESOURCE_LIMITS, thread=PAGE_MAGICK_THREADS),))
+    return _page_executor
+
+def discard_page_executor(executor):
+    """
+    Drop a page pool that broke because one of its processes died (e.g. killed
+    for running out of memory), so the next call to get_page_executor starts a
+    new one instead of failing every later request.
+    """
+    global _page_executor
+    with _page_executor_lock:
+        if _page_executor is executor:
+            _page_executor = None
+    app.logger.warning("Page pool broken; starting a new one for later work")
+    executor.shutdown(wait=False, cancel_futures=True)
+
+def submit_page_work(executor, fn, *args):
+    """
+    Submit work to the page pool, replacing the pool once if it is broken.
+    Returns (executor, Future): the pool the work went to may be a new one.
+    """
+    try:
+        return executor, executor.submit(fn, *args)
+    except BrokenProcessPool:
+        discard_page_executor(executor)
+        executor = get_page_executor()
+        return executor, executor.submit(fn, *args)
+
 def is_pdf(filename):
     """Check if the file is a PDF based on extension"""
     return '.' in filename and filename.rsplit('.', 1)[1].lower() == 'pdf'
 
-def convert_pdf_to_images(pdf_path, output_dir):
-    """Convert PDF to images using pdf2image"""
+def get_pdf_page_count(pdf_path, pdf_hash=None):
+    """Return the number of pages in a PDF without rasterizing it"""
+    if pdf_hash and page_cache.enabled:
+        page_count = page_cache.get_page_count(pdf_hash)
+        if page_count is not None:
+            return page_count
+    
     try:
-        images = pdf2image.convert_from_path(pdf_path, dpi=300, output_folder=output_dir)
-        image_paths = []
-        for i, image in enumerate(images):
-            image_path = os.path.join(output_dir, f'page_{i+1}.png')
-            image.save(image_path, 'PNG')
-            image_paths.append(image_path)
-        return image_paths
+        info = pdf2image.pdfinfo_from_path(pdf_path)
+        page_count = int(info['Pages'])
     except Exception as e:
-        raise Exception(f"Error converting PDF to images: {str(e)}")
-
-def process_image(image_path, output_path, steps=None, params=None):
-    """Process a single image with the specified steps and parameters"""
-    preprocessor = ImagePreprocessor(image_path)
-    
-    if steps:
-        for step in steps:
-            if step == 'deskew':
-                preprocessor.deskew()
-            elif step == 'denoise':
-                level = params.get('denoise_level', 1) if params else 1
-                preprocessor.denoise(level=level)
-            elif step == 'binarize':
-                threshold = params.get('binarize_threshold', 128) if params else 128
-                preprocessor.binarize(threshold=threshold)
-            elif step == 'enhance':
-                factor = params.get('enhance_factor', 2.0) if params else 2.0
-                preprocessor.enhance_contrast(factor=factor)
-    else:
-        # Default pipeline
-        preprocessor.deskew()
-        preprocessor.denoise()
-        preprocessor.binarize()
-        preprocessor.enhance_contrast()
+        raise Exception(f"Error reading PDF info: {str(e)}")
     
-    preprocessor.save(output_path)
-    return output_path
+    if pdf_hash and page_cache.enabled:
+        page_cache.put_page_count(pdf_hash, page_count)
+    return page_count
 
-@app.route('/api/preprocess', methods=['POST'])
-def preprocess():
-    """General preprocessing endpoint that applies a default pipeline"""
-    if 'image' not in request.files and 'file' not in request.files:
-        return jsonify({"error": "No image or PDF provided"}), 400
+def page_windows(pages, window):
+    """Group ascending page numbers into (first, last) runs of at most `window` consecutive pages"""
+    run = []
+    for page_number in pages:
+        if run and (page_number != run[-1] + 1 or len(run) >= window):
+            yield run[0], run[-1]
+            run = []
+        run.append(page_number)
+    if run:
+        yield run[0], run[-1]
+
+def rasterize_pdf_pages(pdf_path, output_dir, pages, dpi=PDF_DPI, window=PDF_PAGE_WINDOW, colorspace='rgb'):
+    """
+    Rasterize the given ascending page numbers with poppler, `window` pages per call.
     
-    file = request.files.get('image') or request.files.get('file')
-    if file.filename == '':
-        return jsonify({"error": "No file selected"}), 400
+    Pages are written by pdftoppm straight to disk as uncompressed PPM and
+    never decoded in Python, so ImageMagick reads the raw pixels directly
+    with no PNG encode/decode. With colorspace 'gray' pdftoppm renders
+    8-bit PGM, a third of the size. Yields (page number, image path).
+    """
+    for first_page, last_page in page_windows(pages, window):
+        try:
+            # A per-window file prefix keeps pages still in flight from
+            # earlier windows out of this window's results
+            image_paths = pdf2image.convert_from_path(pdf_path, dpi=dpi,
+                                                      first_page=first_page, last_page=last_page,
+                                                      output_folder=output_dir,
+                                                      output_file=f'page_{first_page}_',
+                                                      fmt='ppm', grayscale=colorspace == 'gray',
+                                                      paths_only=True)
+        except Exception as e:
+            raise Exception(f"Error converting PDF to images: {str(e)}")
+        
+        for offset, image_path in enumerate(image_paths):
+            yield first_page + offset, image_path
+
+def iter_pdf_pages(pdf_path, output_dir, dpi=PDF_DPI, window=PDF_PAGE_WINDOW, pages=None, pdf_hash=None,
+                   colorspace='rgb'):
+    """
+    Lazily rasterize a PDF, yielding (page number, image path) one page at a time.
     
-    # Create temporary directory for this request
-    request_temp_dir = tempfile.mkdtemp(dir=TEMP_DIR)
+    Only `window` pages are rasterized per poppler call, so peak memory stays
+    bounded regardless of the page count. `pages` restricts rasterization to
+    the given ascending page numbers. When `pdf_hash` is given, pages are
+    served from and added to the rasterized page cache. `colorspace` is
+    'gray' to rasterize pages as 8-bit gray.
+    """
+    if pages is None:
+        pages = range(1, get_pdf_page_count(pdf_path, pdf_hash=pdf_hash) + 1)
     
-    try:
-        if is_pdf(file.filename):
-            # Handle PDF file
-            pdf_path = os.path.join(request_temp_dir, secure_filename(file.filename))
-            file.save(pdf_path)
-            
-            # Convert PDF to images
-            image_paths = convert_pdf_to_images(pdf_path, request_temp_dir)
-            
-            # Process each image
-            processed_paths = []
-            for i, image_path in enumerate(image_paths):
-                output_path = os.path.join(request_temp_dir, f'processed_page_{i+1}.png')
-                process_image(image_path, output_path)
-                processed_paths.append(output_path)
-            
-            # Create a zip file with all processed images
-            zip_path = os.path.join(request_temp_dir, 'processed_images.zip')
-            with zipfile.ZipFile(zip_path, 'w') as zipf:
-                for i, path in enumerate(processed_paths):
-                    zipf.write(path, f'page_{i+1}.png')
-            
-            return send_file(zip_path, mimetype='application/zip', 
-                            as_attachment=True, download_name='processed_images.zip')
+    if not (pdf_hash and page_cache.enabled):
+        yield from rasterize_pdf_pages(pdf_path, output_dir, pages, dpi=dpi, window=window,
+                                       colorspace=colorspace)
+        return
+    
+    def rasterize_and_cache(pending):
+        for page_number, image_path in rasterize_pdf_pages(pdf_path, output_dir, pending, dpi=dpi, window=window,
+                                                           colorspace=colorspace):
+            page_cache.put_file(page_cache.make_key(pdf_hash, page_number, dpi, colorspace), image_path)
+            yield page_number, image_path
+    
+    pending = []
+    for page_number in pages:
+        extension = 'pgm' if colorspace == 'gray' else 'ppm'
+        cached_path = os.path.join(output_dir, f'cached_page_{page_number}.{extension}')
+        if page_cache.get_file(page_cache.make_key(pdf_hash, page_number, dpi, colorspace), cached_path):
+            # Keep page order: flush uncached pages before this one first
+            yield from rasterize_and_cache(pending)
+            pending = []
+            yield page_number, cached_path
         else:
-            # Handle single image file
-            temp_input = os.path.join(request_temp_dir, 'input.png')
-            temp_output = os.path.join(request_temp_dir, 'output.png')
-            file.save(temp_input)
-            
-            # Process the image
-            process_image(temp_input, temp_output)
+            pending.append(page_number)
+            if len(pending) >= window:
+                yield from rasterize_and_cache(pending)
+                pending = []
+    yield from rasterize_and_cache(pending)
+
+def iter_processed_pages(pdf_path, output_dir, plan, concurrency=PAGE_CONCURRENCY, progress=None):
+    """
+    Rasterize and process a PDF, yielding (page number, processed path, details)
+    in page order as soon as each page is ready.
+    
+    Pages already in the result cache are linked in without being
+    rasterized. The rest are fanned out across the shared process pool with
+    at most `concurrency` pages in flight for this request.
+    `details` is the dict returned by `process_image`, or {'cached': True}
+    plus 'cache_key' when a page is served from or stored in the result cache.
+    `progress(pages_done, pages_total)` is called as pages complete.
+    """
+    executor = get_page_executor()
+    pdf_hash = sha256_file(pdf_path) if result_cache.enabled or page_cache.enabled else None
+    page_count = get_pdf_page_count(pdf_path, pdf_hash=pdf_hash)
+    metrics.PDF_PAGE_COUNT.observe(page_count)
+    output_paths = [os.path.join(output_dir, f'processed_page_{n}.{plan.output.extension}')
+                    for n in range(1, page_count + 1)]
+    
+    page_keys = {}
+    if result_cache.enabled:
+        for n in range(1, page_count + 1):
+            page_keys[n] = result_cache.make_key(f'pdf:{pdf_hash}:page:{n}:dpi:{PDF_DPI}', plan)
+    missing_pages = [n for n in range(1, page_count + 1)
+                     if n not in page_keys or not result_cache.get_file(page_keys[n], output_paths[n - 1])]
+    
+    # Pipelines that never need color get their pages rasterized as gray
+    raster_pages = iter_pdf_pages(pdf_path, output_dir, pages=missing_pages, pdf_hash=pdf_hash,
+                                  colorspace=plan.colorspace)
+    missing_pages = set(missing_pages)
+    # (page number, rasterized path or None if cached, Future or finished details)
+    in_flight = deque()
+    pages_done = 0
+    if progress:
+        progress(pages_done, page_count)
+    
+    def finish_oldest():
+        nonlocal pages_done
+        page_number, image_path, result = in_flight.popleft()
+        try:
+            details = result.result() if isinstance(result, Future) else result
+        except BrokenProcessPool:
+            discard_page_executor(executor)
+            raise
+        if image_path is not None:
+            # Drop the rasterized page as soon as it has been processed
+            os.remove(image_path)
+            if page_number in page_keys:
+                result_cache.put_file(page_keys[page_number], output_paths[page_number - 1])
+        if page_number in page_keys:
+            details = dict(details, cache_key=page_keys[page_number])
+        pages_done += 1
+        metrics.record_page(details)
+        if progress:
+            progress(pages_done, page_count)
+        return page_number, output_paths[page_number - 1], details
+    
+    def head_ready():
+        result = in_flight[0][2]
+        return not isinstance(result, Future) or result.done()
+    
+    try:
+        for page_number in range(1, page_count + 1):
+            if page_number in missing_pages:
+                rasterized_number, image_path = next(raster_pages, (None, None))
+                if rasterized_number != page_number:
+                    raise Exception(f"Error converting PDF to images: expected page {page_number}, "
+                                    f"got {rasterized_number}")
+                output_path = output_paths[page_number - 1]
+                if executor is None or concurrency <= 1:
+                    result = process_image(image_path, output_path, plan)
+                else:
+                    executor, result = submit_page_work(executor, process_image, image_path, output_path, plan)
+                in_flight.append((page_number, image_path, result))
+            else:
+                in_flight.append((page_number, None, {'cached': True}))
             
-            return send_file(temp_output, mimetype='image/png')
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
+            # Emit finished pages from the head; block on the oldest once this request hits its cap
+            while in_flight and (head_ready() or len(in_flight) >= concurrency):
+                yield finish_oldest()
+        
+        while in_flight:
+            yield finish_oldest()
     finally:
-        # Clean up temp files
-        if os.path.exists(request_temp_dir) and not app.debug:
-            shutil.rmtree(request_temp_dir)
+        for _, _, result in in_flight:
+            if isinstance(result, Future):
+                result.cancel()
+        raster_pages.close()
 
-@app.route('/api/preprocess/binarize', methods=['POST'])
-def binarize():
-    """Binarize an image to improve OCR accuracy"""
-    if 'image' not in request.files and 'file' not in request.files:
-        return jsonify({"error": "No image or PDF provided"}), 400
+def process_pdf(pdf_path, output_dir, plan, concurrency=PAGE_CONCURRENCY, progress=None):
+    """Rasterize and process a PDF, returning processed page paths in page order"""
+    return [path for _, path, _ in iter_processed_pages(pdf_path, output_dir, plan,
+                                                        concurrency=concurrency, progress=progress)]
+
+def process_upload(blob, plan):
+    """
+    Process an uploaded image, serving repeated uploads from the result cache.
+    Returns (encoded result, details).
+    """
+    key = result_cache.make_key(sha256_bytes(blob), plan)
+    output = result_cache.get(key)
+    if output is not None:
+        details = {'cached': True, 'cache_key': key}
+        metrics.record_page(details)
+        return output, details
     
-    file = request.files.get('image') or request.files.get('file')
-    threshold = request.form.get('threshold', 128, type=int)
+    output, details = process_blob(blob, plan)
+    result_cache.put(key, output)
+    if result_cache.enabled:
+        details['cache_key'] = key
+    metrics.record_page(details)
+    return output, details
+
+def write_pages_zip(processed_paths, zip_path):
+    """Write processed page images to a ZIP archive in page order"""
+    # Every output format is already compressed, so entries are stored rather than deflated
+    with zipfile.ZipFile(zip_path, 'w', compression=zipfile.ZIP_STORED) as zipf:
+        for i, path in enumerate(processed_paths):
+            zipf.write(path, f'page_{i+1}{os.path.splitext(path)[1]}')
+    return zip_path
+
+def write_pages_pdf(processed_paths, pdf_path):
+    """Write processed page images to an image-only PDF in page order"""
+    writer = PdfWriter(dpi=PDF_DPI)
+    with open(pdf_path, 'wb') as f:
+        f.write(writer.start())
+        for path in processed_paths:
+            f.write(writer.add_page(path))
+        f.write(writer.finish())
+    return pdf_path
+
+def write_pages_container(processed_paths, output_dir, output):
+    """Package processed pages in the container requested by an output spec, returning its path"""
+    container_path = os.path.join(output_dir, output.container_name)
+    if output.container == 'tiff':
+        append_tiff_pages(processed_paths, container_path)
+        return container_path
+    if output.container == 'pdf':
+        return write_pages_pdf(processed_paths, container_path)
+    return write_pages_zip(processed_paths, container_path)
+
+class ZipStreamBuffer:
+    """
+    Write-only, unseekable file object that collects ZIP output for streaming.
+    
+    zipfile falls back to data descriptors when it cannot seek, so each entry
+    can be flushed to the client as soon as it has been written.
+    """
     
-    # Create temporary directory for this request
-    request_temp_dir = tempfile.mkdtemp(dir=TEMP_DIR)
+    def __init__(self):
+        self._chunks = []
+        self._offset = 0
     
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._offset += len(data)
+        return len(data)
+    
+    def tell(self):
+        return self._offset
+    
+    def flush(self):
+        pass
+    
+    def drain(self):
+        """Return and forget everything written since the last drain"""
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+def stream_pages_zip(pages, ready=()):
+    """
+    Generate a ZIP archive chunk by chunk from (page number, path, details) tuples.
+    
+    Each `page_N` image entry is emitted as soon as its page is ready, so the
+    client receives page 1 while later pages are still processing. `ready`
+    holds pages already taken from the `pages` generator. A final
+    `timings.json` entry records the cost of every step on every page.
+    """
+    buffer = ZipStreamBuffer()
+    timings = []
     try:
-        if is_pdf(file.filename):
-            # Handle PDF file
-            pdf_path = os.path.join(request_temp_dir, secure_filename(file.filename))
-            file.save(pdf_path)
-            
-            # Convert PDF to images
-            image_paths = convert_pdf_to_images(pdf_path, request_temp_dir)
-            
-            # Process each image
-            processed_paths = []
-            for i, image_path in enumerate(image_paths):
-                output_path = os.path.join(request_temp_dir, f'processed_page_{i+1}.png')
-                process_image(image_path, output_path, steps=['binarize'], 
-                            params={'binarize_threshold': threshold})
-                processed_paths.append(output_path)
-            
-            # Create a zip file with all processed images
-            zip_path = os.path.join(request_temp_dir, 'processed_images.zip')
-            with zipfile.ZipFile(zip_path, 'w') as zipf:
-                for i, path in enumerate(processed_paths):
-                    zipf.write(path, f'page_{i+1}.png')
-            
-            return send_file(zip_path, mimetype='application/zip', 
-                            as_attachment=True, download_name='processed_images.zip')
-        else:
-            # Handle single image file
-            temp_input = os.path.join(request_temp_dir, 'input.png')
-            temp_output = os.path.join(request_temp_dir, 'output.png')
-            file.save(temp_input)
-            
-            # Process the image
-            process_image(temp_input, temp_output, steps=['binarize'], 
-                        params={'binarize_threshold': threshold})
-            
-            return send_file(temp_output, mimetype='image/png')
+        with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_STORED) as zipf:
+            for page_number, path, details in itertools.chain(ready, pages):
+                zipf.write(path, f'page_{page_number}{os.path.splitext(path)[1]}')
+                os.remove(path)
+                timings.append(dict(timings_summary(details), page=page_number))
+                yield buffer.drain()
+            zipf.writestr('timings.json', json.dumps(timings, indent=2))
+        # Central directory
+        yield buffer.drain()
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        # Headers are already sent, so the client sees a truncated archive
+        app.logger.error(f"Error while streaming ZIP: {str(e)}")
+        raise
     finally:
-        # Clean up temp files
-        if os.path.exists(request_temp_dir) and not app.debug:
-            shutil.rmtree(request_temp_dir)
+        # Stops outstanding page work if the client disconnects early
+        pages.close()
 
-@app.route('/api/preprocess/deskew', methods=['POST'])
-def deskew():
-    """Deskew an image to straighten text"""
-    if 'image' not in request.files and 'file' not in request.files:
-        return jsonify({"error": "No image or PDF provided"}), 400
+def stream_pages_pdf(pages, ready=()):
+    """
+    Generate an image-only PDF chunk by chunk from (page number, path) pairs.
     
-    file = request.files.get('image') or request.files.get('file')
+    Each page's objects are emitted as soon as it is ready, like the ZIP
+    stream; the page tree and cross-reference table follow the last page.
+    """
+    writer = PdfWriter(dpi=PDF_DPI)
+    try:
+        yield writer.start()
+        for _, path, _ in itertools.chain(ready, pages):
+            yield writer.add_page(path)
+            os.remove(path)
+        yield writer.finish()
+    except Exception as e:
+        app.logger.error(f"Error while streaming PDF: {str(e)}")
+        raise
+    finally:
+        pages.close()
+
+def stream_pages_tiff(pages, tiff_path, ready=(), chunk_size=1024 * 1024):
+    """
+    Append pages to a multi-page TIFF on disk as they complete, then stream it.
     
-    # Create temporary directory for this request
-    request_temp_dir = tempfile.mkdtemp(dir=TEMP_DIR)
+    TIFF page offsets are patched as pages are appended, so the file can only
+    be sent once it is complete; pages are still never all held in memory.
+    """
+    def page_paths():
+        for _, path, _ in itertools.chain(ready, pages):
+            yield path
+            os.remove(path)
     
     try:
-        if is_pdf(file.filename):
-            # Handle PDF file
-            pdf_path = os.path.join(request_temp_dir, secure_filename(file.filename))
-            file.save(pdf_path)
-            
-            # Convert PDF to images
-            image_paths = convert_pdf_to_images(pdf_path, request_temp_dir)
-            
-            # Process each image
-            processed_paths = []
-            for i, image_path in enumerate(image_paths):
-                output_path = os.path.join(request_temp_dir, f'processed_page_{i+1}.png')
-                process_image(image_path, output_path, steps=['deskew'])
-                processed_paths.append(output_path)
-            
-            # Create a zip file with all processed images
-            zip_path = os.path.join(request_temp_dir, 'processed_images.zip')
-            with zipfile.ZipFile(zip_path, 'w') as zipf:
-                for i, path in enumerate(processed_paths):
-                    zipf.write(path, f'page_{i+1}.png')
-            
-            return send_file(zip_path, mimetype='application/zip', 
-                            as_attachment=True, download_name='processed_images.zip')
-        else:
-            # Handle single image file
-            temp_input = os.path.join(request_temp_dir, 'input.png')
-            temp_output = os.path.join(request_temp_dir, 'output.png')
-            file.save(temp_input)
-            
-            # Process the image
-            process_image(temp_input, temp_output, steps=['deskew'])
-            
-            return send_file(temp_output, mimetype='image/png')
+        append_tiff_pages(page_paths(), tiff_path)
+        with open(tiff_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(chunk_size), b''):
+                yield chunk
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        app.logger.error(f"Error while streaming TIFF: {str(e)}")
+        raise
     finally:
-        # Clean up temp files
-        if os.path.exists(request_temp_dir) and not app.debug:
-            shutil.rmtree(request_temp_dir)
+        pages.close()
 
-@app.route('/api/preprocess/denoise', methods=['POST'])
-def denoise():
-    """Remove noise from an image"""
+def stream_pages(pages, output, work_dir, ready=()):
+    """Generate the response body for processed PDF pages in the requested container"""
+    if output.container == 'tiff':
+        return stream_pages_tiff(pages, os.path.join(work_dir, output.container_name), ready=ready)
+    if output.container == 'pdf':
+        return stream_pages_pdf(pages, ready=ready)
+    return stream_pages_zip(pages, ready=ready)
+
+def error_status(error):
+    """HTTP status for a processing error: oversized input and exhausted resource limits are the client's"""
+    if isinstance(error, ImageTooLargeError):
+        return 413
+    if isinstance(error, (ResourceLimitError, MemoryError)):
+        return 422
+    return 500
+
+def timings_summary(details):
+    """Per-step costs of one processed image, as reported to clients"""
+    return {'cached': details.get('cached', False), **details.get('timings', {})}
+
+def get_upload():
+    """Return (file, None) for the uploaded image or PDF, or (None, error response)"""
     if 'image' not in request.files and 'file' not in request.files:
-        return jsonify({"error": "No image or PDF provided"}), 400
+        return None, (jsonify({"error": "No image or PDF provided"}), 400)
     
     file = request.files.get('image') or request.files.get('file')
-    level = request.form.get('level', 1, type=int)
+    if file.filename == '':
+        return None, (jsonify({"error": "No file selected"}), 400)
+    
+    return file, None
+
+def run_pipeline_request(compile_plan):
+    """
+    Shared request handler for every preprocessing endpoint.
+    
+    Validates the upload, compiles the pipeline plan once via `compile_plan`,
+    then runs it over a single image (in memory) or every page of a PDF
+    (returned as a ZIP of images, a multi-page TIFF or a PDF).
+    """
+    file, error = get_upload()
+    if error:
+        return error
     
-    # Create temporary directory for this request
-    request_temp_dir = tempfile.mkdtemp(dir=TEMP_DIR)
+    try:
+        plan = compile_plan()
+    except PipelineError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    # Single images are processed in memory; only PDFs need a temporary directory
+    request_temp_dir = None
     
     try:
         if is_pdf(file.filename):
-            # Handle PDF file
+            # Handle PDF file in a temporary directory for this request
+            request_temp_dir = tempfile.mkdtemp(dir=TEMP_DIR)
             pdf_path = os.path.join(request_temp_dir, secure_filename(file.filename))
             file.save(pdf_path)
             
-            # Convert PDF to images
-            image_paths = convert_pdf_to_images(pdf_path, request_temp_dir)
-            
-            # Process each image
-            processed_paths = []
-            for i, image_path in enumerate(image_paths):
-                output_path = os.path.join(request_temp_dir, f'processed_page_{i+1}.png')
-                process_image(image_path, output_path, steps=['denoise'], 
-                            params={'denoise_level': level})
-                processed_paths.append(output_path)
+            # Rasterize and process the PDF one page at a time, streaming each
+            # page into the response container as soon as it is ready. The first
+            # page is produced up front so early failures still get a JSON error.
+            pages = iter_processed_pages(pdf_path, request_temp_dir, plan)
+            first_page = next(pages, None)
+            ready = [first_page] if first_page else []
             
-            # Create a zip file with all processed images
-            zip_path = os.path.join(request_temp_dir, 'processed_images.zip')
-            with zipfile.ZipFile(zip_path, 'w') as zipf:
-                for i, path in enumerate(processed_paths):
-                    zipf.write(path, f'page_{i+1}.png')
+            body = stream_pages(pages, plan.output, request_temp_dir, ready=ready)
+            response = Response(body, mimetype=plan.output.container_mimetype,
+                                headers={'Content-Disposition':
+                                         f'attachment; filename={plan.output.container_name}'})
             
-            return send_file(zip_path, mimetype='application/zip', 
-                            as_attachment=True, download_name='processed_images.zip')
+            # The response now owns the temporary directory; remove it once it is closed
+            stream_temp_dir = request_temp_dir
+            def cleanup():
+                pages.close()
+                if os.path.exists(stream_temp_dir) and not app.debug:
+                    shutil.rmtree(stream_temp_dir)
+            response.call_on_close(cleanup)
+            request_temp_dir = None
+            return response
         else:
-            # Handle single image file
-            temp_input = os.path.join(request_temp_dir, 'input.png')
-            temp_output = os.path.join(request_temp_dir, 'output.png')
-            file.save(temp_input)
+            # Handle single image file entirely in memory
+            output, details = process_upload(file.read(), plan)
             
-            # Process the image
-            process_image(temp_input, temp_output, steps=['denoise'], 
-                        params={'denoise_level': level})
-            
-            return send_file(temp_output, mimetype='image/png')
+            response = send_file(io.BytesIO(output), mimetype=plan.output.mimetype)
+            response.headers['X-Preprocess-Timings'] = json.dumps(timings_summary(details),
+                                                                  separators=(',', ':'))
+            return response
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return jsonify({"error": str(e)}), error_status(e)
     finally:
-        # Clean up temp files
-        if os.path.exists(request_temp_dir) and not app.debug:
+        # Clean up temp files for PDF requests
+        if request_temp_dir and os.path.exists(request_temp_dir) and not app.debug:
             shutil.rmtree(request_temp_dir)
 
-@app.route('/api/preprocess/enhance', methods=['POST'])
-def enhance():
-    """Enhance text contrast in an image"""
-    if 'image' not in request.files and 'file' not in request.files:
-        return jsonify({"error": "No image or PDF provided"}), 400
+def sniff_mimetype(data):
+    """Identify a processed image's mimetype from its leading bytes"""
+    if data.startswith(b'\x89PNG'):
+        return 'image/png'
+    if data[:4] in (b'II*\x00', b'MM\x00*'):
+        return 'image/tiff'
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return 'image/webp'
+    if data.startswith(b'\xff\xd8\xff'):
+        return 'image/jpeg'
+    return 'application/octet-stream'
+
+class BatchError(ValueError):
+    """Raised when a batch request is malformed"""
+
+class BatchTooLargeError(BatchError):
+    """Raised when a batch request exceeds the batch limits"""
+
+def is_zip(filename):
+    """Check if the file is a ZIP archive based on extension"""
+    return '.' in filename and filename.rsplit('.', 1)[1].lower() == 'zip'
+
+def read_batch_items(files):
+    """
+    Collect (name, bytes) items from the uploaded files of a batch request.
     
-    file = request.files.get('image') or request.files.get('file')
-    factor = request.form.get('factor', 2.0, type=float)
+    Each upload is either an image or a ZIP of images. Directories, hidden
+    files and macOS resource forks inside ZIPs are skipped.
+    """
+    items = []
+    total_bytes = 0
     
-    # Create temporary directory for this request
-    request_temp_dir = tempfile.mkdtemp(dir=TEMP_DIR)
+    def add(name, data):
+        nonlocal total_bytes
+        total_bytes += len(data)
+        if len(items) >= MAX_BATCH_ITEMS:
+            raise BatchTooLargeError(f"Batch exceeds {MAX_BATCH_ITEMS} items")
+        if total_bytes > MAX_BATCH_BYTES:
+            raise BatchTooLargeError(f"Batch exceeds {MAX_BATCH_BYTES} bytes of input")
+        items.append((name, data))
+    
+    for file in files:
+        if not file.filename:
+            continue
+        if not is_zip(file.filename):
+            add(file.filename, file.read())
+            continue
+        
+        try:
+            with zipfile.ZipFile(io.BytesIO(file.read())) as archive:
+                entries = [info for info in archive.infolist()
+                           if not info.is_dir() and not os.path.basename(info.filename).startswith('.')
+                           and not info.filename.startswith('__MACOSX/')]
+                # Check declared sizes first so a ZIP bomb is rejected before decompression
+                if total_bytes + sum(info.file_size for info in entries) > MAX_BATCH_BYTES:
+                    raise BatchTooLargeError(f"Batch exceeds {MAX_BATCH_BYTES} bytes of input")
+                for info in entries:
+                    add(info.filename, archive.read(info))
+        except zipfile.BadZipFile:
+            raise BatchError(f"Invalid ZIP archive: {file.filename}")
+    
+    if not items:
+        raise BatchError("No images provided")
+    return items
+
+def batch_output_name(index, name, extension):
+    """Name of a batch item's result inside the response archive"""
+    stem = secure_filename(os.path.splitext(os.path.basename(name))[0]) or 'image'
+    return f'{index + 1:04d}_{stem}.{extension}'
+
+def iter_batch_results(items, plan, concurrency=PAGE_CONCURRENCY):
+    """
+    Process batch items across the shared process pool, yielding
+    (index, name, output bytes or None, details or error message) in input order.
+    
+    Cached items skip Wand entirely; failures are reported per item rather
+    than failing the whole batch. Each item's bytes are released from `items`
+    once it has been handed off, so only items in flight stay in memory.
+    """
+    executor = get_page_executor()
+    in_flight = deque()
+    
+    def finish_oldest():
+        index, name, key, result = in_flight.popleft()
+        try:
+            output, details = result.result() if isinstance(result, Future) else result
+        except BrokenProcessPool as e:
+            discard_page_executor(executor)
+            return index, name, None, str(e)
+        except Exception as e:
+            return index, name, None, str(e)
+        if key is not None and not details.get('cached'):
+            result_cache.put(key, output)
+            details = dict(details, cache_key=key)
+        metrics.record_page(details)
+        return index, name, output, details
     
     try:
-        if is_pdf(file.filename):
-            # Handle PDF file
-            pdf_path = os.path.join(request_temp_dir, secure_filename(file.filename))
-            file.save(pdf_path)
-            
-            # Convert PDF to images
-            image_paths = convert_pdf_to_images(pdf_path, request_temp_dir)
-            
-            # Process each image
-            processed_paths = []
-            for i, image_path in enumerate(image_paths):
-                output_path = os.path.join(request_temp_dir, f'processed_page_{i+1}.png')
-                process_image(image_path, output_path, steps=['enhance'], 
-                            params={'enhance_factor': factor})
-                processed_paths.append(output_path)
-            
-            # Create a zip file with all processed images
-            zip_path = os.path.join(request_temp_dir, 'processed_images.zip')
-            with zipfile.ZipFile(zip_path, 'w') as zipf:
-                for i, path in enumerate(processed_paths):
-                    zipf.write(path, f'page_{i+1}.png')
+        for index in range(len(items)):
+            name, data = items[index]
+            items[index] = None
+            key = result_cache.make_key(sha256_bytes(data), plan) if result_cache.enabled else None
+            output = result_cache.get(key) if key else None
+            if output is not None:
+                result = (output, {'cached': True, 'cache_key': key})
+            elif is_pdf(name):
+                result = Future()
+                result.set_exception(BatchError("PDFs are not supported in batch requests; use /api/jobs"))
+            elif executor is None or concurrency <= 1:
+                try:
+                    result = process_blob(data, plan)
+                except Exception as e:
+                    result = Future()
+                    result.set_exception(e)
+            else:
+                executor, result = submit_page_work(executor, process_blob, data, plan)
+            del data
+            in_flight.append((index, name, key, result))
             
-            return send_file(zip_path, mimetype='application/zip', 
-                            as_attachment=True, download_name='processed_images.zip')
-        else:
-            # Handle single image file
-            temp_input = os.path.join(request_temp_dir, 'input.png')
-            temp_output = os.path.join(request_temp_dir, 'output.png')
-            file.save(temp_input)
-            
-            # Process the image
-            process_image(temp_input, temp_output, steps=['enhance'], 
-                        params={'enhance_factor': factor})
-            
-            return send_file(temp_output, mimetype='image/png')
+            # Emit finished items from the head; block on the oldest once this request hits its cap
+            while in_flight and (not isinstance(in_flight[0][3], Future) or in_flight[0][3].done()
+                                 or len(in_flight) >= concurrency):
+                yield finish_oldest()
+        
+        while in_flight:
+            yield finish_oldest()
+    finally:
+        for _, _, _, result in in_flight:
+            if isinstance(result, Future):
+                result.cancel()
+
+def stream_batch_zip(results, extension):
+    """
+    Generate a ZIP of batch results chunk by chunk, ending with manifest.json,
+    which records the status of every item.
+    """
+    buffer = ZipStreamBuffer()
+    manifest = []
+    try:
+        with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_STORED) as zipf:
+            for index, name, output, details in results:
+                if output is None:
+                    manifest.append({"index": index, "name": name, "status": "error", "error": details})
+                    continue
+                output_name = batch_output_name(index, name, extension)
+                zipf.writestr(output_name, output)
+                manifest.append({"index": index, "name": name, "status": "ok", "output": output_name,
+                                 "cached": details.get('cached', False),
+                                 "deskew_angle": details.get('deskew_angle'),
+                                 "timings": details.get('timings')})
+                yield buffer.drain()
+            zipf.writestr('manifest.json', json.dumps({"items": manifest}, indent=2),
+                          compress_type=zipfile.ZIP_DEFLATED)
+        yield buffer.drain()
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        app.logger.error(f"Error while streaming batch ZIP: {str(e)}")
+        raise
     finally:
-        # Clean up temp files
-        if os.path.exists(request_temp_dir) and not app.debug:
-            shutil.rmtree(request_temp_dir)
+        results.close()
+
+def page_event(page_number, pages_total, result, details, delivery, elapsed, mimetype):
+    """Build the progress event for one finished page, given its output path or encoded bytes"""
+    event = {
+        "page": page_number,
+        "pages_total": pages_total,
+        "cached": details.get('cached', False),
+        "deskew_angle": details.get('deskew_angle'),
+        "width": details.get('width'),
+        "height": details.get('height'),
+        "timings": dict(details.get('timings', {}), elapsed=elapsed),
+    }
+    if delivery == 'url' and details.get('cache_key'):
+        event["url"] = url_for('get_result', key=details['cache_key'])
+    elif isinstance(result, bytes):
+        event["image"] = base64.b64encode(result).decode('ascii')
+    else:
+        with open(result, 'rb') as f:
+            event["image"] = base64.b64encode(f.read()).decode('ascii')
+    event["mimetype"] = mimetype
+    return event
+
+def format_event(event, stream_format, name='page'):
+    """Serialize an event as an NDJSON line or a Server-Sent Event"""
+    data = json.dumps(event)
+    if stream_format == 'sse':
+        return f"event: {name}\ndata: {data}\n\n"
+    return data + '\n'
+
+def run_job(job, progress):
+    """Execute a queued job, returning (result path, mimetype, download name)"""
+    plan = Plan.from_dict(json.loads(job['plan']))
+    job_dir = os.path.dirname(job['input_path'])
+    
+    if is_pdf(job['filename']):
+        # Start from a clean work directory in case an earlier attempt was interrupted
+        work_dir = os.path.join(job_dir, 'work')
+        shutil.rmtree(work_dir, ignore_errors=True)
+        os.makedirs(work_dir)
+        
+        processed_paths = process_pdf(job['input_path'], work_dir, plan, progress=progress)
+        container_path = write_pages_container(processed_paths, job_dir, plan.output)
+        shutil.rmtree(work_dir)
+        return container_path, plan.output.container_mimetype, plan.output.container_name
+    
+    with open(job['input_path'], 'rb') as f:
+        blob = f.read()
+    progress(0, 1)
+    output_name = f'output.{plan.output.extension}'
+    output_path = os.path.join(job_dir, output_name)
+    with open(output_path, 'wb') as f:
+        f.write(process_upload(blob, plan)[0])
+    progress(1, 1)
+    return output_path, plan.output.mimetype, output_name
+
+job_runner = JobRunner(job_store, run_job, workers=JOB_WORKERS, retention=JOB_RETENTION)
+
+def start_job_runner():
+    """Start this process's job workers; called by the server entry points, never on import"""
+    if JOB_WORKERS > 0:
+        job_runner.start()
+
+@app.before_request
+def start_request_metrics():
+    g.metrics_start = metrics.start_request()
+
+@app.after_request
+def finish_request_metrics(response):
+    """Record the request in the metrics once its response body has been sent"""
+    if 'metrics_start' not in g:
+        return response
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    start, method, bytes_in = g.metrics_start, request.method, request.content_length
+    sent = [response.content_length or 0]
+    if response.content_length is None and response.is_streamed:
+        # Streamed bodies are counted as they are sent
+        response.response = metrics.count_bytes(response.response, sent)
+    response.call_on_close(lambda: metrics.finish_request(route, method, response.status_code, start,
+                                                          bytes_in, sent[0]))
+    return response
+
+def run_preset(name):
+    """Handle a request with one of the named pipeline presets"""
+    return run_pipeline_request(lambda: PRESETS[name].compile(request.form))
+
+@app.route('/api/preprocess', methods=['POST'])
+def preprocess():
+    """General preprocessing endpoint that applies a default pipeline"""
+    return run_preset('default')
+
+@app.route('/api/preprocess/binarize', methods=['POST'])
+def binarize():
+    """Binarize an image to improve OCR accuracy"""
+    return run_preset('binarize')
+
+@app.route('/api/preprocess/deskew', methods=['POST'])
+def deskew():
+    """Deskew an image to straighten text"""
+    return run_preset('deskew')
+
+@app.route('/api/preprocess/denoise', methods=['POST'])
+def denoise():
+    """Remove noise from an image"""
+    return run_preset('denoise')
+
+@app.route('/api/preprocess/enhance', methods=['POST'])
+def enhance():
+    """Enhance text contrast in an image"""
+    return run_preset('enhance')
 
 @app.route('/api/preprocess/pipeline', methods=['POST'])
 def pipeline():
     """Apply a custom pipeline of preprocessing steps"""
-    if 'image' not in request.files and 'file' not in request.files:
-        return jsonify({"error": "No image or PDF provided"}), 400
+    return run_pipeline_request(lambda: compile_request(request.form))
+
+@app.route('/api/preprocess/pipeline/stream', methods=['POST'])
+def pipeline_stream():
+    """
+    Apply a custom pipeline and stream per-page results as they complete.
+    Responds with NDJSON, or Server-Sent Events when the client accepts
+    text/event-stream or sends stream_format=sse. Each page event carries the
+    page index, timings, deskew angle and either base64 image data
+    (delivery=base64, the default) or a fetch URL (delivery=url).
+    """
+    file, error = get_upload()
+    if error:
+        return error
     
-    file = request.files.get('image') or request.files.get('file')
-    steps = request.form.getlist('steps')
+    try:
+        plan = compile_request(request.form)
+    except PipelineError as e:
+        return jsonify({"error": str(e)}), 400
     
-    # Get parameters
-    params = {}
-    if 'params' in request.form:
-        try:
-            import json
-            params = json.loads(request.form.get('params'))
-        except:
-            pass
+    stream_format = request.form.get('stream_format')
+    if not stream_format:
+        stream_format = 'sse' if request.accept_mimetypes.best == 'text/event-stream' else 'ndjson'
+    if stream_format not in ('ndjson', 'sse'):
+        return jsonify({"error": "stream_format must be 'ndjson' or 'sse'"}), 400
     
-    # Create temporary directory for this request
-    request_temp_dir = tempfile.mkdtemp(dir=TEMP_DIR)
+    delivery = request.form.get('delivery', 'base64')
+    if delivery not in ('base64', 'url'):
+        return jsonify({"error": "delivery must be 'base64' or 'url'"}), 400
+    if delivery == 'url' and not result_cache.enabled:
+        return jsonify({"error": "delivery=url requires the result cache to be enabled"}), 400
+    
+    # Single images are processed in memory; only PDFs need a temporary directory
+    request_temp_dir = None
+    start = time.perf_counter()
+    counts = {'pages_total': None}
     
     try:
         if is_pdf(file.filename):
-            # Handle PDF file
+            request_temp_dir = tempfile.mkdtemp(dir=TEMP_DIR)
             pdf_path = os.path.join(request_temp_dir, secure_filename(file.filename))
             file.save(pdf_path)
             
-            # Convert PDF to images
-            image_paths = convert_pdf_to_images(pdf_path, request_temp_dir)
-            
-            # Process each image
-            processed_paths = []
-            for i, image_path in enumerate(image_paths):
-                output_path = os.path.join(request_temp_dir, f'processed_page_{i+1}.png')
-                process_image(image_path, output_path, steps=steps, params=params)
-                processed_paths.append(output_path)
-            
-            # Create a zip file with all processed images
-            zip_path = os.path.join(request_temp_dir, 'processed_images.zip')
-            with zipfile.ZipFile(zip_path, 'w') as zipf:
-                for i, path in enumerate(processed_paths):
-                    zipf.write(path, f'page_{i+1}.png')
-            
-            return send_file(zip_path, mimetype='application/zip', 
-                            as_attachment=True, download_name='processed_images.zip')
+            def progress(pages_done, pages_total):
+                counts['pages_total'] = pages_total
+            pages = iter_processed_pages(pdf_path, request_temp_dir, plan, progress=progress)
         else:
-            # Handle single image file
-            temp_input = os.path.join(request_temp_dir, 'input.png')
-            temp_output = os.path.join(request_temp_dir, 'output.png')
-            file.save(temp_input)
+            blob = file.read()
+            counts['pages_total'] = 1
             
-            # Process the image
-            process_image(temp_input, temp_output, steps=steps, params=params)
-            
-            return send_file(temp_output, mimetype='image/png')
+            def single_image():
+                output, details = process_upload(blob, plan)
+                yield 1, output, details
+            pages = single_image()
+        
+        def generate():
+            pages_sent = 0
+            try:
+                for page_number, result, details in pages:
+                    event = page_event(page_number, counts['pages_total'], result, details, delivery,
+                                       time.perf_counter() - start, plan.output.mimetype)
+                    if isinstance(result, str):
+                        os.remove(result)
+                    pages_sent += 1
+                    yield format_event(event, stream_format)
+                yield format_event({"done": True, "pages": pages_sent,
+                                    "elapsed": time.perf_counter() - start}, stream_format, name='done')
+            except Exception as e:
+                app.logger.error(f"Error while streaming pages: {str(e)}")
+                yield format_event({"error": str(e), "status": error_status(e), "pages": pages_sent},
+                                   stream_format, name='error')
+            finally:
+                pages.close()
+        
+        mimetype = 'text/event-stream' if stream_format == 'sse' else 'application/x-ndjson'
+        response = Response(stream_with_context(generate()), mimetype=mimetype,
+                            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+        
+        # The response now owns the temporary directory; remove it once it is closed
+        stream_temp_dir = request_temp_dir
+        def cleanup():
+            pages.close()
+            if stream_temp_dir and os.path.exists(stream_temp_dir) and not app.debug:
+                shutil.rmtree(stream_temp_dir)
+        response.call_on_close(cleanup)
+        request_temp_dir = None
+        return response
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return jsonify({"error": str(e)}), error_status(e)
     finally:
-        # Clean up temp files
-        if os.path.exists(request_temp_dir) and not app.debug:
+        if request_temp_dir and os.path.exists(request_temp_dir) and not app.debug:
             shutil.rmtree(request_temp_dir)
 
+@app.route('/api/preprocess/batch', methods=['POST'])
+def batch():
+    """
+    Apply one pipeline to many images in a single request.
+    Accepts several `images`/`image`/`file` uploads and/or ZIP archives of images,
+    plus the same `steps`/`params` fields as /api/preprocess/pipeline.
+    Items are processed in parallel and returned as one ZIP with a
+    manifest.json reporting the status of each item.
+    """
+    files = request.files.getlist('images') + request.files.getlist('image') + request.files.getlist('file')
+    if not files:
+        return jsonify({"error": "No images provided"}), 400
+    
+    try:
+        plan = compile_request(request.form)
+    except PipelineError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    try:
+        items = read_batch_items(files)
+    except BatchTooLargeError as e:
+        return jsonify({"error": str(e)}), 413
+    except BatchError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    results = iter_batch_results(items, plan)
+    response = Response(stream_batch_zip(results, plan.output.extension), mimetype='application/zip',
+                        headers={'Content-Disposition': 'attachment; filename=processed_batch.zip'})
+    response.call_on_close(results.close)
+    return response
+
+@app.route('/api/results/<key>', methods=['GET'])
+def get_result(key):
+    """Fetch a processed image from the result cache by key"""
+    if not re.fullmatch(r'[0-9a-f]{64}', key):
+        return jsonify({"error": "Result not found"}), 404
+    
+    output = result_cache.get(key)
+    if output is None:
+        return jsonify({"error": "Result not found or expired"}), 404
+    return send_file(io.BytesIO(output), mimetype=sniff_mimetype(output))
+
 @app.route('/api/preprocess/google_vision', methods=['POST'])
 def google_vision():
     """
@@ -403,82 +995,84 @@ def google_vision():
     Applies the optimal preprocessing steps in the recommended order:
     1. deskew → 2. enhance → 3. denoise
     """
-    if 'image' not in request.files and 'file' not in request.files:
-        return jsonify({"error": "No image or PDF provided"}), 400
-    
-    file = request.files.get('image') or request.files.get('file')
-    if file.filename == '':
-        return jsonify({"error": "No file selected"}), 400
+    return run_preset('google_vision')
+
+def job_status(job):
+    """Public JSON view of a job"""
+    status = {
+        "job_id": job['id'],
+        "status": job['status'],
+        "filename": job['filename'],
+        "pages_done": job['pages_done'],
+        "pages_total": job['pages_total'],
+        "created_at": job['created_at'],
+        "updated_at": job['updated_at'],
+        "status_url": url_for('get_job', job_id=job['id']),
+    }
+    if job['status'] == COMPLETED:
+        status["result_url"] = url_for('get_job_result', job_id=job['id'])
+    if job['error']:
+        status["error"] = job['error']
+    return status
+
+@app.route('/api/jobs', methods=['POST'])
+def create_job():
+    """
+    Queue a pipeline run and return its job ID immediately.
+    Accepts the same inputs as /api/preprocess/pipeline.
+    """
+    file, error = get_upload()
+    if error:
+        return error
     
-    # Get optional parameters with Google Vision optimized defaults
-    enhance_factor = request.form.get('enhance_factor', 1.5)
-    try:
-        enhance_factor = float(enhance_factor)
-    except ValueError:
-        enhance_factor = 1.5
-        
-    denoise_level = request.form.get('denoise_level', 1)
     try:
-        denoise_level = int(denoise_level)
-    except ValueError:
-        denoise_level = 1
-    
-    # Create temporary directory for this request
-    request_temp_dir = tempfile.mkdtemp(dir=TEMP_DIR)
+        plan = compile_request(request.form)
+    except PipelineError as e:
+        return jsonify({"error": str(e)}), 400
     
+    job_dir = tempfile.mkdtemp(dir=JOBS_DIR)
     try:
-        if is_pdf(file.filename):
-            # Handle PDF file
-            pdf_path = os.path.join(request_temp_dir, secure_filename(file.filename))
-            file.save(pdf_path)
-            
-            # Convert PDF to images
-            image_paths = convert_pdf_to_images(pdf_path, request_temp_dir)
-            
-            # Process each image with Google Vision optimized pipeline
-            processed_paths = []
-            for i, image_path in enumerate(image_paths):
-                output_path = os.path.join(request_temp_dir, f'processed_page_{i+1}.png')
-                
-                # Apply Google Vision optimized pipeline
-                steps = ['deskew', 'enhance', 'denoise']
-                params = {
-                    'enhance_factor': enhance_factor,
-                    'denoise_level': denoise_level
-                }
-                process_image(image_path, output_path, steps=steps, params=params)
-                processed_paths.append(output_path)
-            
-            # Create a zip file with all processed images
-            zip_path = os.path.join(request_temp_dir, 'processed_images.zip')
-            with zipfile.ZipFile(zip_path, 'w') as zipf:
-                for i, path in enumerate(processed_paths):
-                    zipf.write(path, f'page_{i+1}.png')
-            
-            return send_file(zip_path, mimetype='application/zip', 
-                            as_attachment=True, download_name='processed_images.zip')
-        else:
-            # Handle single image file
-            temp_input = os.path.join(request_temp_dir, 'input.png')
-            temp_output = os.path.join(request_temp_dir, 'output.png')
-            file.save(temp_input)
-            
-            # Apply Google Vision optimized pipeline
-            steps = ['deskew', 'enhance', 'denoise']
-            params = {
-                'enhance_factor': enhance_factor,
-                'denoise_level': denoise_level
-            }
-            process_image(temp_input, temp_output, steps=steps, params=params)
-            
-            return send_file(temp_output, mimetype='image/png')
+        input_path = os.path.join(job_dir, secure_filename(file.filename) or 'input')
+        file.save(input_path)
+        job_id = job_store.create(file.filename, input_path, plan)
     except Exception as e:
+        shutil.rmtree(job_dir, ignore_errors=True)
         return jsonify({"error": str(e)}), 500
-    finally:
-        # Clean up temp files
-        if os.path.exists(request_temp_dir) and not app.debug:
-            shutil.rmtree(request_temp_dir)
+    
+    return jsonify(job_status(job_store.get(job_id))), 202
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Report a job's status and page progress"""
+    job = job_store.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job_status(job))
+
+@app.route('/api/jobs/<job_id>/result', methods=['GET'])
+def get_job_result(job_id):
+    """Download the output of a completed job"""
+    job = job_store.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    if job['status'] != COMPLETED:
+        return jsonify(job_status(job)), 409
+    
+    return send_file(job['result_path'], mimetype=job['result_mimetype'],
+                     as_attachment=True, download_name=job['result_name'])
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Expose service metrics in the Prometheus text format, aggregated across workers"""
+    body, content_type = metrics.render([temp_dir_usage])
+    return Response(body, content_type=content_type)
+
+@app.route('/api/cache/stats', methods=['GET'])
+def cache_stats():
+    """Report cache hit/miss counters for this worker and disk usage"""
+    return jsonify({"results": result_cache.stats(), "pages": page_cache.stats()})
 
 if __name__ == '__main__':
+    start_job_runner()
     port = int(os.environ.get('PORT', 5000))
     app.run(host='0.0.0.0', port=port, debug=True)
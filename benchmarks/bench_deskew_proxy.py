@@ -0,0 +1,49 @@
+"""
+Accuracy vs speed of skew estimation on a downscaled proxy.
+
+Renders synthetic text pages with known skew angles and reports, for each
+proxy width, the mean estimation time and the mean absolute angle error.
+
+    python benchmarks/bench_deskew_proxy.py [--dpi 300] [--widths 0 2000 1500 1000 750 500]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from preprocessing import ImagePreprocessor
+from benchmarks.corpus import render_text_page, page_to_png_bytes
+
+DEFAULT_ANGLES = [-7.5, -4.0, -2.0, -0.5, 0.5, 1.0, 3.0, 6.0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--dpi', type=int, default=300)
+    parser.add_argument('--angles', type=float, nargs='+', default=DEFAULT_ANGLES)
+    parser.add_argument('--widths', type=int, nargs='+', default=[0, 2000, 1500, 1000, 750, 500],
+                        help='Proxy widths to test; 0 means full resolution')
+    args = parser.parse_args()
+
+    # Pillow rotates counter-clockwise, so the correcting (clockwise) angle equals the skew
+    corpus = [(angle, page_to_png_bytes(render_text_page(dpi=args.dpi, angle=angle, seed=i)))
+              for i, angle in enumerate(args.angles)]
+
+    print(f"{'proxy':>8} {'ms/page':>10} {'mean |err|':>12} {'max |err|':>10}")
+    for width in args.widths:
+        timings, errors = [], []
+        for expected, blob in corpus:
+            preprocessor = ImagePreprocessor.from_blob(blob)
+            start = time.perf_counter()
+            angle = preprocessor.estimate_skew_angle(proxy_width=width or None)
+            timings.append(time.perf_counter() - start)
+            errors.append(abs((angle or 0.0) - expected))
+        label = 'full' if not width else str(width)
+        print(f"{label:>8} {sum(timings) / len(timings) * 1000:10.1f} "
+              f"{sum(errors) / len(errors):12.3f} {max(errors):10.3f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+"""
+Encode time vs output size for each output format and compression option.
+
+Encodes a synthetic 300 DPI page, both as an 8-bit grayscale scan and after
+binarization, with every output spec below and reports the mean encode
+time and the encoded size.
+
+    python benchmarks/bench_encode.py [--dpi 300] [--repeat 3]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from preprocessing import ImagePreprocessor
+from pipeline import OutputSpec
+from benchmarks.corpus import render_text_page, page_to_png_bytes
+
+SPECS = [
+    ('png default', OutputSpec('png')),
+    ('png level 1', OutputSpec('png', compression=1)),
+    ('png level 6', OutputSpec('png', compression=6)),
+    ('png level 9', OutputSpec('png', compression=9)),
+    ('png level 1 16-bit', OutputSpec('png', compression=1, bit_depth=16)),
+    ('tiff lzw', OutputSpec('tiff')),
+    ('tiff uncompressed', OutputSpec('tiff', compression=0)),
+    ('tiff deflate 1', OutputSpec('tiff', compression=1)),
+    ('tiff deflate 9', OutputSpec('tiff', compression=9)),
+    ('webp lossless 0', OutputSpec('webp', compression=0)),
+    ('webp lossless 9', OutputSpec('webp', compression=9)),
+    ('jpeg q75', OutputSpec('jpeg', quality=75)),
+    ('jpeg q90', OutputSpec('jpeg', quality=90)),
+]
+
+
+def encode(blob, spec, binarize):
+    preprocessor = ImagePreprocessor.from_blob(blob)
+    if binarize:
+        preprocessor.binarize()
+    start = time.perf_counter()
+    output = preprocessor.to_blob(**spec.encoder_args())
+    return time.perf_counter() - start, len(output)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--dpi', type=int, default=300)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    blob = page_to_png_bytes(render_text_page(dpi=args.dpi, angle=1.5))
+
+    for binarize in (False, True):
+        print(f"\n{'binarized' if binarize else 'grayscale'} page at {args.dpi} DPI")
+        print(f"{'output':>20} {'ms':>10} {'KB':>10}")
+        for label, spec in SPECS:
+            runs = [encode(blob, spec, binarize) for _ in range(args.repeat)]
+            seconds = sum(t for t, _ in runs) / len(runs)
+            print(f"{label:>20} {seconds * 1000:10.1f} {runs[0][1] / 1024:10.1f}")
+
+
+if __name__ == '__main__':
+    main()
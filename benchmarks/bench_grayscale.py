@@ -0,0 +1,64 @@
+"""
+Cost of a pipeline on a color page with and without grayscale planning.
+
+Runs a preset over a 300 DPI RGB page twice: with the plan's own colorspace
+(converted to 8-bit gray once at load when every step allows it) and forced
+to stay in color, and reports the time and peak pixel-cache memory of each.
+
+    python benchmarks/bench_grayscale.py [--dpi 300] [--preset default] [--repeat 3]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image
+
+from preprocessing import ImagePreprocessor
+from pipeline import PRESETS, Plan
+from benchmarks.corpus import render_text_page, page_to_png_bytes
+
+
+def run(blob, plan):
+    preprocessor = ImagePreprocessor.from_blob(blob)
+    start = time.perf_counter()
+    records = plan.run(preprocessor)
+    elapsed = time.perf_counter() - start
+    peak = max((record['pixel_cache_bytes'] or 0) for record in preprocessor.collector.records)
+    return elapsed, peak, records
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--dpi', type=int, default=300)
+    parser.add_argument('--preset', default='default', choices=sorted(PRESETS))
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    # A warm paper tint, as on a phone photo of a printed page: each channel is
+    # scaled differently, so the page has real color rather than neutral gray
+    gray = render_text_page(dpi=args.dpi, angle=1.5, noise=8)
+    page = Image.merge('RGB', [gray.point(lambda value: value * scale + offset)
+                               for scale, offset in ((0.98, 4), (0.90, 10), (0.72, 20))])
+    blob = page_to_png_bytes(page)
+
+    plan = PRESETS[args.preset].compile({})
+    plans = [(plan.colorspace, plan), ('rgb (forced)', Plan(plan.calls, output=plan.output, colorspace='rgb'))]
+
+    print(f"{args.preset} preset on an RGB page {page.width}x{page.height}")
+    print(f"{'colorspace':>14} {'ms':>10} {'peak cache MB':>14}")
+    for label, candidate in plans:
+        best = None
+        for _ in range(args.repeat):
+            elapsed, peak, records = run(blob, candidate)
+            if best is None or elapsed < best[0]:
+                best = (elapsed, peak, records)
+        print(f"{label:>14} {best[0] * 1000:10.1f} {best[1] / 2**20:14.1f}")
+        for record in best[2]:
+            print(f"{'':>14}   {record['step']:<20} {record['seconds'] * 1000:8.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
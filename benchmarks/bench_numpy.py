@@ -0,0 +1,75 @@
+"""
+Cost of moving a 300 DPI page between Wand and NumPy.
+
+Compares `ImagePreprocessor.to_numpy` / `from_numpy` (direct pixel export and
+import) with Wand's array interface and with a PNG round-trip through Pillow,
+for a grayscale and an RGB page.
+
+    python benchmarks/bench_numpy.py [--dpi 300] [--repeat 5]
+"""
+import argparse
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from PIL import Image as PILImage
+
+from preprocessing import ImagePreprocessor
+from benchmarks.corpus import render_text_page, page_to_png_bytes
+
+
+def best_of(repeat, func):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--dpi', type=int, default=300)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    page = render_text_page(dpi=args.dpi, angle=1.5)
+    for mode in ('L', 'RGB'):
+        preprocessor = ImagePreprocessor.from_blob(page_to_png_bytes(page.convert(mode)))
+        if mode == 'L':
+            preprocessor.image.transform_colorspace('gray')
+        array = preprocessor.to_numpy()
+        resized = np.ascontiguousarray(array[::2, ::2])
+        other = ImagePreprocessor.from_blob(page_to_png_bytes(page.convert(mode)))
+
+        def png_round_trip():
+            # What custom steps did before: encode, decode with Pillow, then back
+            decoded = np.asarray(PILImage.open(io.BytesIO(preprocessor.image.make_blob('png'))))
+            buffer = io.BytesIO()
+            PILImage.fromarray(decoded).save(buffer, 'PNG')
+            ImagePreprocessor.from_blob(buffer.getvalue())
+
+        cases = [
+            ('to_numpy uint8', lambda: preprocessor.to_numpy()),
+            ('to_numpy float32', lambda: preprocessor.to_numpy(dtype=np.float32)),
+            ('np.array(wand image)', lambda: np.array(preprocessor.image)),
+            ('from_numpy in place', lambda: preprocessor.from_numpy(array)),
+            # Alternates between two sizes, so every call allocates a new image
+            ('from_numpy new size', lambda: other.from_numpy(
+                resized if other.image.width == array.shape[1] else array)),
+            ('png round-trip', png_round_trip),
+        ]
+
+        print(f"\n{mode} page {array.shape[1]}x{array.shape[0]} ({array.nbytes / 2**20:.1f} MB as uint8)")
+        print(f"{'conversion':>24} {'ms':>10}")
+        for label, func in cases:
+            print(f"{label:>24} {best_of(args.repeat, func) * 1000:10.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""
+Benchmark the PDF rasterization path, per page.
+
+Compares the legacy path (pdf2image PIL images re-encoded to PNG, then decoded
+by Wand) with the current path (pdftoppm writes PPM, Wand reads it directly).
+
+    python benchmarks/bench_rasterize.py [--pages 5] [--dpi 300] [--pdf file.pdf]
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pdf2image
+from wand.image import Image
+
+# Importing the app must not start a job runner against the real jobs database
+os.environ.setdefault('JOB_WORKERS', '0')
+
+from app import iter_pdf_pages
+from benchmarks.corpus import render_text_page, write_pdf
+
+
+def legacy_path(pdf_path, output_dir, dpi):
+    images = pdf2image.convert_from_path(pdf_path, dpi=dpi, output_folder=output_dir)
+    for i, image in enumerate(images):
+        image_path = os.path.join(output_dir, f'page_{i+1}.png')
+        image.save(image_path, 'PNG')
+        with Image(filename=image_path):
+            pass
+    return len(images)
+
+
+def ppm_path(pdf_path, output_dir, dpi):
+    count = 0
+    for _, image_path in iter_pdf_pages(pdf_path, output_dir, dpi=dpi):
+        with Image(filename=image_path):
+            pass
+        os.remove(image_path)
+        count += 1
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--pages', type=int, default=5)
+    parser.add_argument('--dpi', type=int, default=300)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--pdf', help='Use an existing PDF instead of the synthetic one')
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp()
+    try:
+        pdf_path = args.pdf
+        if not pdf_path:
+            pdf_path = os.path.join(work_dir, 'corpus.pdf')
+            write_pdf(pdf_path, [render_text_page(dpi=args.dpi, seed=i) for i in range(args.pages)], dpi=args.dpi)
+
+        for name, func in (('legacy_png', legacy_path), ('ppm', ppm_path)):
+            best = None
+            for _ in range(args.repeat):
+                run_dir = tempfile.mkdtemp(dir=work_dir)
+                start = time.perf_counter()
+                pages = func(pdf_path, run_dir, args.dpi)
+                elapsed = time.perf_counter() - start
+                shutil.rmtree(run_dir)
+                best = elapsed if best is None else min(best, elapsed)
+            print(f"{name:>10}: {best / pages * 1000:8.1f} ms/page ({pages} pages @ {args.dpi} DPI)")
+    finally:
+        shutil.rmtree(work_dir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,216 @@
+"""
+Regression benchmark suite for the preprocessing steps and endpoint presets.
+
+Generates a deterministic synthetic corpus (text pages at several DPIs, skew
+angles and noise levels, plus a few PDFs), then times every ImagePreprocessor
+step and the `default` and `google_vision` presets on it. Each case runs in a
+fresh process, which reports wall time, CPU time and peak RSS; the results
+are written to a JSON file. Runs offline; needs ImageMagick, poppler and Pillow.
+
+    python benchmarks/bench_suite.py [--output bench_results.json] [--repeat 3]
+    python benchmarks/bench_suite.py --baseline old.json --threshold 0.2
+
+With `--baseline`, cases whose median wall time grew by more than the
+threshold are listed and the exit status is 1.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import queue as queue_module
+import resource
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.corpus import render_text_page, write_pdf
+
+DPIS = [150, 300]
+ANGLES = [0.0, 2.5]
+NOISE_LEVELS = [0, 12]
+PDF_PAGES = 3
+PRESETS = ['default', 'google_vision']
+
+
+def build_corpus(directory, dpis):
+    """
+    Write the synthetic corpus to a directory.
+
+    Returns:
+        list: (name, path) pairs for every image and PDF
+    """
+    items = []
+    seed = 0
+    for dpi in dpis:
+        for angle in ANGLES:
+            for noise in NOISE_LEVELS:
+                name = f'page_{dpi}dpi_skew{angle:g}_noise{noise}'
+                path = os.path.join(directory, f'{name}.png')
+                render_text_page(dpi=dpi, angle=angle, seed=seed, noise=noise).save(path, 'PNG')
+                items.append((name, path))
+                seed += 1
+        name = f'doc_{dpi}dpi_{PDF_PAGES}pages'
+        path = os.path.join(directory, f'{name}.pdf')
+        pages = [render_text_page(dpi=dpi, angle=1.0, seed=seed + i, noise=6) for i in range(PDF_PAGES)]
+        write_pdf(path, pages, dpi=dpi)
+        items.append((name, path))
+        seed += PDF_PAGES
+    return items
+
+
+def build_cases(corpus, steps):
+    """Return (case name, kind, target, input path) for every benchmark case."""
+    cases = []
+    for name, path in corpus:
+        if not path.endswith('.pdf'):
+            for step in steps:
+                cases.append((f'step/{step}/{name}', 'step', step, path))
+        for preset in PRESETS:
+            cases.append((f'preset/{preset}/{name}', 'preset', preset, path))
+    return cases
+
+
+def run_case(kind, target, path, repeat, queue):
+    """Run one case in this (fresh) process and put its measurements on the queue."""
+    # Measure the processing itself: no caches, no page pool, no job workers
+    os.environ.update({'RESULT_CACHE_MAX_BYTES': '0', 'PAGE_CACHE_MAX_BYTES': '0',
+                       'PAGE_WORKERS': '1', 'JOB_WORKERS': '0'})
+    try:
+        from preprocessing import ImagePreprocessor
+        from pipeline import PRESETS as PIPELINE_PRESETS, compile_pipeline
+        import app
+
+        baseline_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        walls, cpus = [], []
+        for _ in range(repeat):
+            work_dir = tempfile.mkdtemp()
+            try:
+                if kind == 'step':
+                    plan = compile_pipeline([target])
+                    preprocessor = ImagePreprocessor(path)
+                    wall, cpu = time.perf_counter(), time.process_time()
+                    plan.run(preprocessor)
+                else:
+                    plan = PIPELINE_PRESETS[target].compile({})
+                    wall, cpu = time.perf_counter(), time.process_time()
+                    if path.endswith('.pdf'):
+                        app.process_pdf(path, work_dir, plan)
+                    else:
+                        app.process_image(path, os.path.join(work_dir, 'output.png'), plan)
+                walls.append(time.perf_counter() - wall)
+                cpus.append(time.process_time() - cpu)
+            finally:
+                shutil.rmtree(work_dir, ignore_errors=True)
+
+        queue.put({
+            'wall_seconds': {'min': min(walls), 'median': statistics.median(walls), 'runs': walls},
+            'cpu_seconds': {'min': min(cpus), 'median': statistics.median(cpus), 'runs': cpus},
+            # ru_maxrss is in kilobytes on Linux
+            'peak_rss_bytes': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+            'baseline_rss_bytes': baseline_rss * 1024,
+        })
+    except Exception as e:
+        queue.put({'error': f'{type(e).__name__}: {e}'})
+
+
+def measure(kind, target, path, repeat):
+    """Run a case in a freshly spawned process, so its peak RSS is its own."""
+    context = multiprocessing.get_context('spawn')
+    queue = context.Queue()
+    process = context.Process(target=run_case, args=(kind, target, path, repeat, queue))
+    process.start()
+    while True:
+        try:
+            result = queue.get(timeout=1)
+            break
+        except queue_module.Empty:
+            # A crash in ImageMagick kills the process without reporting back
+            if not process.is_alive():
+                result = {'error': f'Process exited with code {process.exitcode}'}
+                break
+    process.join()
+    return result
+
+
+def environment():
+    """Describe the machine and library versions the results were taken on."""
+    from wand.version import MAGICK_VERSION, VERSION as WAND_VERSION
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'wand': WAND_VERSION,
+        'imagemagick': MAGICK_VERSION,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+    }
+
+
+def compare(results, baseline_path, threshold):
+    """Return (case, old, new) for cases whose median wall time regressed beyond the threshold."""
+    with open(baseline_path) as f:
+        baseline = {case['case']: case for case in json.load(f)['cases'] if 'error' not in case}
+    regressions = []
+    for case in results:
+        old = baseline.get(case['case'])
+        if old is None or 'error' in case:
+            continue
+        old_wall, new_wall = old['wall_seconds']['median'], case['wall_seconds']['median']
+        if new_wall > old_wall * (1 + threshold):
+            regressions.append((case['case'], old_wall, new_wall))
+    return regressions
+
+
+def main():
+    from pipeline import STEPS
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--output', default='bench_results.json', help='JSON file to write')
+    parser.add_argument('--repeat', type=int, default=3, help='Timed runs per case')
+    parser.add_argument('--dpis', type=int, nargs='+', default=DPIS)
+    parser.add_argument('--only', help='Run only cases whose name contains this text')
+    parser.add_argument('--baseline', help='Earlier results to compare against')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='Relative wall time increase reported as a regression')
+    args = parser.parse_args()
+
+    corpus_dir = tempfile.mkdtemp()
+    try:
+        corpus = build_corpus(corpus_dir, args.dpis)
+        cases = build_cases(corpus, sorted(STEPS))
+        if args.only:
+            cases = [case for case in cases if args.only in case[0]]
+
+        results = []
+        for name, kind, target, path in cases:
+            result = dict(case=name, kind=kind, target=target, input=os.path.basename(path),
+                          **measure(kind, target, path, args.repeat))
+            results.append(result)
+            if 'error' in result:
+                print(f"{name:<60} ERROR {result['error']}")
+            else:
+                print(f"{name:<60} {result['wall_seconds']['median'] * 1000:9.1f} ms wall "
+                      f"{result['cpu_seconds']['median'] * 1000:9.1f} ms cpu "
+                      f"{result['peak_rss_bytes'] / 2**20:7.1f} MB peak")
+    finally:
+        shutil.rmtree(corpus_dir)
+
+    with open(args.output, 'w') as f:
+        json.dump({'environment': environment(), 'repeat': args.repeat, 'cases': results}, f, indent=2)
+    print(f"Wrote {len(results)} results to {args.output}")
+
+    if args.baseline:
+        regressions = compare(results, args.baseline, args.threshold)
+        for name, old, new in regressions:
+            print(f"REGRESSION {name}: {old * 1000:.1f} ms -> {new * 1000:.1f} ms")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+"""
+Throughput of page processing for each split of cores between worker processes
+and ImageMagick (OpenMP) threads.
+
+Runs the default preset over a batch of synthetic pages with every
+(processes, threads per operation) combination and reports pages/sec, so
+PAGE_WORKERS / WEB_CONCURRENCY and MAGICK_THREAD_LIMIT / PAGE_MAGICK_THREADS
+can be chosen for a machine size. Combinations using more than the available
+cores are included to show the cost of oversubscription.
+
+    python benchmarks/bench_threads.py [--pages 24] [--dpi 300] [--cores 8] [--output threads.json]
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from preprocessing import ImagePreprocessor, set_thread_limit
+from pipeline import PRESETS
+from scheduling import available_cpus
+from benchmarks.corpus import render_text_page
+
+
+def process_page(path):
+    preprocessor = ImagePreprocessor(path)
+    PRESETS['default'].compile({}).run(preprocessor)
+    return len(preprocessor.to_blob(format='png'))
+
+
+def splits(cores):
+    """Every (processes, threads) pair with processes * threads up to twice the cores."""
+    for processes in range(1, cores + 1):
+        for threads in range(1, cores + 1):
+            if processes * threads <= 2 * cores:
+                yield processes, threads
+
+
+def measure(paths, processes, threads):
+    # Spawned workers start without any OpenMP state inherited from this process
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=processes, mp_context=context,
+                             initializer=set_thread_limit, initargs=(threads,)) as executor:
+        # Warm up every worker (imports, ImageMagick start-up) outside the timing
+        list(executor.map(process_page, paths[:processes]))
+        start = time.perf_counter()
+        list(executor.map(process_page, paths))
+        return len(paths) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--pages', type=int, default=24)
+    parser.add_argument('--dpi', type=int, default=300)
+    parser.add_argument('--cores', type=int, default=available_cpus(),
+                        help='Cores to plan for (defaults to the cores available to this process)')
+    parser.add_argument('--output', help='Also write the results to this JSON file')
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp()
+    try:
+        paths = []
+        for i in range(args.pages):
+            path = os.path.join(work_dir, f'page_{i}.png')
+            render_text_page(dpi=args.dpi, angle=1.5, seed=i, noise=8).save(path, 'PNG')
+            paths.append(path)
+
+        print(f"{args.pages} pages @ {args.dpi} DPI, {args.cores} cores")
+        print(f"{'processes':>10} {'threads':>8} {'pages/s':>10}")
+        results = []
+        for processes, threads in splits(args.cores):
+            pages_per_second = measure(paths, processes, threads)
+            results.append({'processes': processes, 'threads': threads, 'pages_per_second': pages_per_second})
+            print(f"{processes:>10} {threads:>8} {pages_per_second:10.2f}")
+    finally:
+        shutil.rmtree(work_dir)
+
+    best = max(results, key=lambda result: result['pages_per_second'])
+    print(f"Best: {best['processes']} process(es) x {best['threads']} thread(s), "
+          f"{best['pages_per_second']:.2f} pages/s")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'cores': args.cores, 'pages': args.pages, 'dpi': args.dpi, 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""
+Deterministic synthetic corpus for the benchmarks.
+
+Pages are drawn with Pillow as rows of dark "glyph" boxes on a white page,
+which is close enough to printed text for deskew, denoise and binarization
+timings, and needs no fonts or network access.
+"""
+import io
+import random
+
+from PIL import Image, ImageChops, ImageDraw
+
+LETTER_INCHES = (8.5, 11)
+NOISE_TILE = 256
+
+
+def render_text_page(dpi=300, angle=0.0, seed=0, noise=0):
+    """
+    Render a synthetic text page.
+
+    Args:
+        dpi (int): Resolution of the page (a letter page at 300 DPI is 2550x3300)
+        angle (float): Skew angle in degrees applied after drawing
+        seed (int): Seed for the word layout and the speckles
+        noise (float): Standard deviation of the sensor noise, in gray levels;
+            also scatters dark speckles like a dusty scanner glass
+
+    Returns:
+        PIL.Image.Image: Grayscale ('L') page image
+    """
+    rng = random.Random(seed)
+    width, height = int(LETTER_INCHES[0] * dpi), int(LETTER_INCHES[1] * dpi)
+    page = Image.new('L', (width, height), 255)
+    draw = ImageDraw.Draw(page)
+
+    margin = dpi
+    glyph_height = max(2, dpi // 12)
+    line_height = glyph_height * 2
+    y = margin
+    while y + glyph_height < height - margin:
+        x = margin
+        while True:
+            word_length = rng.randint(2, 9)
+            glyph_widths = [rng.randint(glyph_height // 2, glyph_height) for _ in range(word_length)]
+            gap = max(1, glyph_height // 8)
+            word_width = sum(glyph_widths) + gap * (word_length - 1)
+            if x + word_width > width - margin:
+                break
+            for glyph_width in glyph_widths:
+                draw.rectangle([x, y, x + glyph_width - 1, y + glyph_height - 1], fill=rng.randint(0, 60))
+                x += glyph_width + gap
+            x += glyph_height
+        y += line_height
+
+    if angle:
+        page = page.rotate(angle, resample=Image.BICUBIC, expand=True, fillcolor=255)
+    if noise:
+        page = add_noise(page, noise, rng)
+    return page
+
+
+def add_noise(page, sigma, rng):
+    """Add Gaussian noise and speckles to a grayscale page."""
+    draw = ImageDraw.Draw(page)
+    speckle_size = max(1, page.width // 1000)
+    for _ in range(int(sigma * page.width * page.height / 200000)):
+        x, y = rng.randrange(page.width), rng.randrange(page.height)
+        draw.rectangle([x, y, x + speckle_size, y + speckle_size], fill=rng.randint(0, 80))
+
+    # Image.effect_noise draws from C's rand(), so build a seeded tile and repeat it instead
+    tile = Image.new('L', (NOISE_TILE, NOISE_TILE))
+    tile.putdata([min(255, max(0, int(rng.gauss(128, sigma)))) for _ in range(NOISE_TILE * NOISE_TILE)])
+    noise = Image.new('L', page.size)
+    for x in range(0, page.width, NOISE_TILE):
+        for y in range(0, page.height, NOISE_TILE):
+            noise.paste(tile, (x, y))
+    return ImageChops.add(page, noise, scale=1.0, offset=-128)
+
+
+def page_to_png_bytes(page):
+    """Encode a page as PNG bytes, as an upload would arrive."""
+    buffer = io.BytesIO()
+    page.save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+def write_pdf(path, pages, dpi=300):
+    """Write a list of page images to an image-only PDF at the given DPI."""
+    first, rest = pages[0], pages[1:]
+    first.convert('RGB').save(path, 'PDF', resolution=dpi, save_all=True,
+                              append_images=[page.convert('RGB') for page in rest])
+    return path
@@ -0,0 +1,301 @@
+import os
+import json
+import time
+import uuid
+import shutil
+import hashlib
+import logging
+import tempfile
+import threading
+
+from wand.version import MAGICK_VERSION, VERSION as WAND_VERSION
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Bump when processing changes in a way that should invalidate cached results
+CACHE_SCHEMA_VERSION = 1
+
+
+def sha256_bytes(data):
+    """Return the hex SHA-256 digest of a bytes object."""
+    return hashlib.sha256(data).hexdigest()
+
+
+def sha256_file(path, chunk_size=1024 * 1024):
+    """Return the hex SHA-256 digest of a file, read in chunks."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def link_or_copy(source, destination):
+    """Hard-link a file when possible (same filesystem), falling back to a copy."""
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copyfile(source, destination)
+
+
+class DiskCache:
+    """
+    A size-bounded LRU cache of blobs on local disk, with TTL expiry.
+
+    Entries are plain files named after their key, so the cache can be shared
+    by every gunicorn worker and page worker on the host. A file's mtime is
+    its write time (for TTL) and its atime its last use (for LRU).
+
+    Writes do not rescan the directory: each process keeps a running total
+    from its last scan plus its own writes, and scans (and evicts) only when
+    that total exceeds the budget or the last scan is `scan_interval` seconds
+    old. Entries written by other processes are therefore noticed at the
+    next scan, and expired entries are still never served.
+    """
+
+    def __init__(self, directory, max_bytes, ttl, name='cache', scan_interval=60):
+        """
+        Args:
+            directory (str): Directory holding the cache entries
+            max_bytes (int): Total size budget; 0 disables the cache
+            ttl (int): Seconds an entry stays valid after it is written; 0 for no expiry
+            name (str): Label of the cache in the lookup metrics
+            scan_interval (int): Longest time between directory scans while writing
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.name = name
+        self.scan_interval = scan_interval
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # Bytes on disk as of the last scan plus this process's writes since (None before the first scan)
+        self._bytes = None
+        self._last_scan = 0.0
+        if self.enabled:
+            os.makedirs(directory, exist_ok=True)
+
+    @property
+    def enabled(self):
+        return self.max_bytes > 0
+
+    def _path(self, key):
+        return os.path.join(self.directory, key)
+
+    def _count(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+        # Per-process counters only show the worker that answers; the metrics add up every worker
+        metrics.CACHE_LOOKUPS.labels(cache=self.name, result='hit' if hit else 'miss').inc()
+
+    def _lookup(self, key):
+        """Return the path of a live entry and mark it as used, or None."""
+        if not self.enabled:
+            return None
+
+        path = self._path(key)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            self._count(hit=False)
+            return None
+
+        now = time.time()
+        if self.ttl and now - stat.st_mtime > self.ttl:
+            self._remove(path)
+            self._count(hit=False)
+            return None
+
+        # Record the access for LRU while keeping the write time for TTL
+        os.utime(path, (now, stat.st_mtime))
+        self._count(hit=True)
+        return path
+
+    def get(self, key):
+        """
+        Return the cached bytes for a key, or None on a miss.
+        """
+        path = self._lookup(key)
+        if path is None:
+            return None
+        try:
+            with open(path, 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            # Evicted by another process between the lookup and the read
+            return None
+
+    def get_file(self, key, output_path):
+        """
+        Place the cached entry for a key at `output_path`, hard-linked when possible.
+
+        Returns:
+            bool: True on a hit, False on a miss
+        """
+        path = self._lookup(key)
+        if path is None:
+            return False
+        try:
+            link_or_copy(path, output_path)
+        except FileNotFoundError:
+            # Evicted by another process between the lookup and the link
+            return False
+        return True
+
+    def put(self, key, data):
+        """
+        Store bytes under a key, then evict entries to stay within budget.
+        """
+        if not self.enabled or len(data) > self.max_bytes:
+            return
+
+        try:
+            # Write to a temporary file and rename, so readers never see partial entries
+            fd, temp_path = tempfile.mkstemp(dir=self.directory, prefix='.tmp-')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(temp_path, self._path(key))
+            self._added(len(data))
+        except OSError as e:
+            logger.error(f"Error writing cache entry {key}: {str(e)}")
+
+    def put_file(self, key, path):
+        """Store a file under a key without reading it into memory."""
+        size = os.path.getsize(path)
+        if not self.enabled or size > self.max_bytes:
+            return
+
+        try:
+            temp_path = os.path.join(self.directory, f'.tmp-{uuid.uuid4().hex}')
+            link_or_copy(path, temp_path)
+            os.replace(temp_path, self._path(key))
+            self._added(size)
+        except OSError as e:
+            logger.error(f"Error writing cache entry {key}: {str(e)}")
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def _entries(self):
+        entries = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.is_file() and not entry.name.startswith('.tmp-'):
+                    try:
+                        entries.append((entry.path, entry.stat()))
+                    except FileNotFoundError:
+                        pass
+        return entries
+
+    def _added(self, size):
+        """Account for a new entry, scanning the directory only when eviction may be needed."""
+        with self._lock:
+            if self._bytes is not None:
+                self._bytes += size
+            due = (self._bytes is None or self._bytes > self.max_bytes
+                   or time.time() - self._last_scan >= self.scan_interval)
+        if due:
+            self._evict()
+
+    def _evict(self):
+        """Drop expired entries, then least recently used ones until under budget."""
+        now = time.time()
+        live = []
+        for path, stat in self._entries():
+            if self.ttl and now - stat.st_mtime > self.ttl:
+                self._remove(path)
+            else:
+                live.append((path, stat))
+
+        total = sum(stat.st_size for _, stat in live)
+        if total > self.max_bytes:
+            for path, stat in sorted(live, key=lambda item: item[1].st_atime):
+                self._remove(path)
+                total -= stat.st_size
+                if total <= self.max_bytes:
+                    break
+
+        with self._lock:
+            self._bytes = total
+            self._last_scan = now
+
+    def stats(self):
+        """Return hit/miss counters for this process plus current disk usage.
+
+        The `preprocess_cache_lookups_total` metric has the counters of every process.
+        """
+        entries = self._entries() if self.enabled else []
+        with self._lock:
+            hits, misses = self.hits, self.misses
+        lookups = hits + misses
+        return {
+            'enabled': self.enabled,
+            'hits': hits,
+            'misses': misses,
+            'hit_ratio': hits / lookups if lookups else 0.0,
+            'entries': len(entries),
+            'bytes': sum(stat.st_size for _, stat in entries),
+            'max_bytes': self.max_bytes,
+            'ttl': self.ttl,
+        }
+
+
+class ResultCache(DiskCache):
+    """
+    Content-addressed cache of processed images.
+
+    Keys combine the input's content hash, the compiled pipeline plan (with
+    its output format) and the library versions, so any change to one of
+    them produces a different key.
+    """
+
+    def make_key(self, input_hash, plan):
+        """
+        Build the cache key for processing an input with a plan.
+
+        Args:
+            input_hash (str): Content hash identifying the input image or page
+            plan (Plan): The compiled pipeline plan, including its output spec
+
+        Returns:
+            str: Hex digest usable as a file name
+        """
+        spec = json.dumps({
+            'input': input_hash,
+            'plan': plan.to_dict(),
+            'versions': [CACHE_SCHEMA_VERSION, WAND_VERSION, MAGICK_VERSION],
+        }, sort_keys=True)
+        return sha256_bytes(spec.encode('utf-8'))
+
+
+class PageCache(DiskCache):
+    """
+    Cache of rasterized PDF pages, so several pipelines over the same document
+    rasterize it only once.
+
+    Pages are keyed by the PDF's content hash, page number, DPI and colorspace.
+    The document's page count is cached alongside, so a fully cached document
+    never needs poppler at all.
+    """
+
+    def make_key(self, pdf_hash, page_number, dpi, colorspace='rgb'):
+        """Build the cache key for one rasterized page."""
+        return sha256_bytes(f'page:{pdf_hash}:{page_number}:{dpi}:{colorspace}'.encode('utf-8'))
+
+    def get_page_count(self, pdf_hash):
+        """Return the cached page count of a document, or None."""
+        data = self.get(sha256_bytes(f'count:{pdf_hash}'.encode('utf-8')))
+        return int(data) if data is not None else None
+
+    def put_page_count(self, pdf_hash, page_count):
+        """Remember the page count of a document."""
+        self.put(sha256_bytes(f'count:{pdf_hash}'.encode('utf-8')), str(page_count).encode('utf-8'))
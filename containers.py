@@ -0,0 +1,147 @@
+import zlib
+import logging
+
+from PIL import Image
+from PIL.TiffImagePlugin import AppendingTiffWriter
+
+logger = logging.getLogger(__name__)
+
+
+def append_tiff_pages(paths, output_path):
+    """
+    Assemble single-page TIFFs into one multi-page TIFF, page by page.
+
+    Pages are appended as encoded, without decoding them, so each keeps its
+    own compression (Group 4 for bilevel pages, LZW or deflate otherwise) and
+    only one page is held in memory at a time.
+
+    Args:
+        paths (iterable): Paths of single-page TIFF files, in page order; may be
+            a generator that yields pages as they complete
+        output_path (str): Path of the multi-page TIFF to write
+
+    Returns:
+        int: Number of pages written
+    """
+    count = 0
+    with AppendingTiffWriter(output_path, new=True) as tiff:
+        for path in paths:
+            with open(path, 'rb') as f:
+                tiff.write(f.read())
+            tiff.newFrame()
+            count += 1
+    logger.info(f"Wrote {count} page(s) to {output_path}")
+    return count
+
+
+class PdfWriter:
+    """
+    Minimal writer for image-only PDFs that emits each page as soon as it is added.
+
+    Every method returns the bytes to append to the output, so a PDF can be
+    streamed straight into a response. The catalog (object 1) and page tree
+    (object 2) are written at the end with the cross-reference table, so only
+    the object offsets are kept in memory.
+    """
+
+    def __init__(self, dpi=300):
+        """
+        Args:
+            dpi (int): Resolution assumed for pages whose image carries none
+        """
+        self.dpi = dpi
+        self.position = 0
+        self.offsets = {}
+        self.page_ids = []
+        self.next_id = 3
+
+    def _emit(self, data):
+        self.position += len(data)
+        return data
+
+    def _object(self, body, stream=None, obj_id=None):
+        if obj_id is None:
+            obj_id = self.next_id
+            self.next_id += 1
+        self.offsets[obj_id] = self.position
+        data = f'{obj_id} 0 obj\n'.encode('ascii') + body
+        if stream is not None:
+            data += b'\nstream\n' + stream + b'\nendstream'
+        return obj_id, self._emit(data + b'\nendobj\n')
+
+    def start(self):
+        """Return the file header."""
+        return self._emit(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+
+    def _image_data(self, path):
+        """Return (XObject dictionary entries, stream data, width, height, dpi) for a page image."""
+        with Image.open(path) as image:
+            dpi = image.info.get('dpi', (self.dpi, self.dpi))[0] or self.dpi
+            width, height = image.size
+
+            # JPEG pages are embedded as they are; everything else is deflated raw pixels
+            if image.format == 'JPEG' and image.mode in ('L', 'RGB'):
+                colorspace = 'DeviceGray' if image.mode == 'L' else 'DeviceRGB'
+                with open(path, 'rb') as f:
+                    return (f'/ColorSpace /{colorspace} /BitsPerComponent 8 /Filter /DCTDecode',
+                            f.read(), width, height, dpi)
+
+            if image.mode == '1':
+                # Packed rows with 1 = white, which matches DeviceGray at 1 bit
+                colorspace, bits, raw = 'DeviceGray', 1, image.tobytes()
+            elif image.mode in ('I;16', 'I;16B'):
+                colorspace, bits, raw = 'DeviceGray', 16, image.tobytes('raw', 'I;16B')
+            elif image.mode == 'I':
+                low, high = image.getextrema()
+                if low >= 0 and high <= 65535:
+                    # Pillow opens 16-bit grayscale PNGs as 32-bit 'I'; convert('L') would clip them to white
+                    colorspace, bits, raw = 'DeviceGray', 16, image.tobytes('raw', 'I;16B')
+                else:
+                    # Wider integer ranges are scaled to 8 bits rather than clipped
+                    scale = 255 / ((high - low) or 1)
+                    colorspace, bits = 'DeviceGray', 8
+                    raw = image.point(lambda value: (value - low) * scale).convert('L').tobytes()
+            elif image.mode in ('L', 'LA', 'F'):
+                colorspace, bits, raw = 'DeviceGray', 8, image.convert('L').tobytes()
+            else:
+                colorspace, bits, raw = 'DeviceRGB', 8, image.convert('RGB').tobytes()
+
+        return (f'/ColorSpace /{colorspace} /BitsPerComponent {bits} /Filter /FlateDecode',
+                zlib.compress(raw), width, height, dpi)
+
+    def add_page(self, path):
+        """
+        Add a page holding one image, scaled to its resolution.
+
+        Args:
+            path (str): Path of the page image (PNG, TIFF, WebP or JPEG)
+
+        Returns:
+            bytes: The page's objects
+        """
+        entries, stream, width, height, dpi = self._image_data(path)
+        points_width, points_height = width * 72 / dpi, height * 72 / dpi
+
+        image_id, image_data = self._object(
+            f'<< /Type /XObject /Subtype /Image /Width {width} /Height {height} {entries} '
+            f'/Length {len(stream)} >>'.encode('ascii'), stream)
+        content = f'q {points_width:.2f} 0 0 {points_height:.2f} 0 0 cm /Im0 Do Q'.encode('ascii')
+        content_id, content_data = self._object(f'<< /Length {len(content)} >>'.encode('ascii'), content)
+        page_id, page_data = self._object(
+            f'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {points_width:.2f} {points_height:.2f}] '
+            f'/Resources << /XObject << /Im0 {image_id} 0 R >> >> /Contents {content_id} 0 R >>'.encode('ascii'))
+        self.page_ids.append(page_id)
+        return image_data + content_data + page_data
+
+    def finish(self):
+        """Return the page tree, catalog, cross-reference table and trailer."""
+        kids = ' '.join(f'{page_id} 0 R' for page_id in self.page_ids)
+        _, pages = self._object(f'<< /Type /Pages /Kids [{kids}] /Count {len(self.page_ids)} >>'.encode('ascii'),
+                                obj_id=2)
+        _, catalog = self._object(b'<< /Type /Catalog /Pages 2 0 R >>', obj_id=1)
+
+        xref_position = self.position
+        xref = [f'xref\n0 {self.next_id}\n', '0000000000 65535 f \n']
+        xref += [f'{self.offsets[obj_id]:010d} 00000 n \n' for obj_id in range(1, self.next_id)]
+        xref.append(f'trailer\n<< /Size {self.next_id} /Root 1 0 R >>\nstartxref\n{xref_position}\n%%EOF\n')
+        return pages + catalog + self._emit(''.join(xref).encode('ascii'))
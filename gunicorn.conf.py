@@ -0,0 +1,31 @@
+"""
+Gunicorn settings shared by every deployment; loaded automatically from the
+working directory. Command-line options still override anything set here.
+"""
+import os
+import shutil
+
+# prometheus_client reads this when it is imported, so it must be set before the
+# workers import the app. Each worker writes its samples to files in this
+# directory and /metrics aggregates them.
+os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR',
+                      os.path.join(os.path.dirname(os.path.abspath(__file__)), 'temp', 'metrics'))
+
+
+def on_starting(server):
+    # Files left by a previous run would be merged into the new counters
+    directory = os.environ['PROMETHEUS_MULTIPROC_DIR']
+    shutil.rmtree(directory, ignore_errors=True)
+    os.makedirs(directory)
+
+
+def post_worker_init(worker):
+    # Job workers run in the serving processes only; importing the app never starts them
+    import app
+    app.start_job_runner()
+
+
+def child_exit(server, worker):
+    # Drop the in-flight gauge of a worker that exited
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,71 @@
+import time
+import functools
+import logging
+from contextlib import contextmanager
+
+from wand.resource import limits
+
+logger = logging.getLogger(__name__)
+
+
+def magick_memory():
+    """Return the bytes of memory ImageMagick currently holds for pixel caches."""
+    try:
+        return int(limits.resource('memory'))
+    except Exception:
+        return None
+
+
+class StepCollector:
+    """
+    Records the cost of each ImagePreprocessor step.
+
+    Every record holds the step's wall and CPU time, the image dimensions
+    before and after, and the memory ImageMagick holds for pixel caches once
+    the step is done. Steps called from inside another step (e.g. `rotate`
+    from `deskew`) are recorded with a greater depth.
+    """
+
+    def __init__(self):
+        self.records = []
+        self._depth = 0
+
+    @contextmanager
+    def measure(self, step, preprocessor):
+        """
+        Record one step applied to a preprocessor.
+
+        Args:
+            step (str): Name of the step
+            preprocessor (ImagePreprocessor): The preprocessor whose image the step changes
+        """
+        record = {'step': step, 'depth': self._depth,
+                  'input_size': [preprocessor.image.width, preprocessor.image.height]}
+        memory_before = magick_memory()
+        wall, cpu = time.perf_counter(), time.process_time()
+        self._depth += 1
+        try:
+            yield record
+        finally:
+            self._depth -= 1
+            record['seconds'] = time.perf_counter() - wall
+            record['cpu_seconds'] = time.process_time() - cpu
+            record['output_size'] = [preprocessor.image.width, preprocessor.image.height]
+            record['pixel_cache_bytes'] = magick_memory()
+            if memory_before is not None and record['pixel_cache_bytes'] is not None:
+                record['pixel_cache_delta'] = record['pixel_cache_bytes'] - memory_before
+            self.records.append(record)
+            logger.debug(f"Step {step} took {record['seconds']:.3f}s")
+
+    def steps(self):
+        """Return the records of top-level steps, in the order they ran."""
+        return [record for record in self.records if record['depth'] == 0]
+
+
+def instrumented(method):
+    """Decorate an ImagePreprocessor method so its collector records each call."""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.collector.measure(method.__name__, self):
+            return method(self, *args, **kwargs)
+    return wrapper
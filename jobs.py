@@ -0,0 +1,266 @@
+import os
+import json
+import time
+import uuid
+import shutil
+import sqlite3
+import logging
+import threading
+from contextlib import closing
+
+logger = logging.getLogger(__name__)
+
+QUEUED = 'queued'
+RUNNING = 'running'
+COMPLETED = 'completed'
+FAILED = 'failed'
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    input_path TEXT NOT NULL,
+    plan TEXT NOT NULL,
+    pages_done INTEGER NOT NULL DEFAULT 0,
+    pages_total INTEGER,
+    result_path TEXT,
+    result_mimetype TEXT,
+    result_name TEXT,
+    error TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    heartbeat_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs (status, created_at);
+'''
+
+
+class JobStore:
+    """
+    Durable job queue backed by SQLite.
+
+    Every call opens its own connection, so the store can be shared by
+    threads and by every gunicorn worker on the host. Running jobs send
+    heartbeats; a job whose heartbeat goes stale (its worker died or was
+    restarted) is handed out again by `claim`.
+    """
+
+    def __init__(self, db_path, stale_after=120, max_attempts=3):
+        """
+        Args:
+            db_path (str): Path of the SQLite database file
+            stale_after (int): Seconds without a heartbeat before a running job is re-queued
+            max_attempts (int): Times a job is started before it is marked failed
+        """
+        self.db_path = db_path
+        self.stale_after = stale_after
+        self.max_attempts = max_attempts
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        with closing(self._connect()) as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.executescript(SCHEMA)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def create(self, filename, input_path, plan):
+        """
+        Queue a new job.
+
+        Args:
+            filename (str): Original upload file name
+            input_path (str): Where the upload has been saved
+            plan (Plan): Compiled pipeline plan
+
+        Returns:
+            str: The job ID
+        """
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with closing(self._connect()) as conn:
+            conn.execute(
+                'INSERT INTO jobs (id, status, filename, input_path, plan, created_at, updated_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (job_id, QUEUED, filename, input_path, json.dumps(plan.to_dict()), now, now))
+        logger.info(f"Queued job {job_id} for {filename}")
+        return job_id
+
+    def get(self, job_id):
+        """Return a job as a dict, or None if it does not exist."""
+        with closing(self._connect()) as conn:
+            row = conn.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        return dict(row) if row else None
+
+    def claim(self):
+        """
+        Atomically take the oldest queued (or stale running) job.
+
+        Returns:
+            dict: The claimed job, or None if the queue is empty
+        """
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute(
+                'SELECT * FROM jobs WHERE status = ? OR (status = ? AND heartbeat_at < ?) '
+                'ORDER BY created_at LIMIT 1',
+                (QUEUED, RUNNING, now - self.stale_after)).fetchone()
+            if row is None:
+                conn.execute('COMMIT')
+                return None
+
+            if row['attempts'] >= self.max_attempts:
+                conn.execute('UPDATE jobs SET status = ?, error = ?, updated_at = ? WHERE id = ?',
+                             (FAILED, 'Job was interrupted too many times', now, row['id']))
+                conn.execute('COMMIT')
+                return self.claim()
+
+            conn.execute(
+                'UPDATE jobs SET status = ?, attempts = attempts + 1, pages_done = 0, '
+                'heartbeat_at = ?, updated_at = ? WHERE id = ?',
+                (RUNNING, now, now, row['id']))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        finally:
+            conn.close()
+
+        job = dict(row)
+        job['status'] = RUNNING
+        return job
+
+    def update_progress(self, job_id, pages_done, pages_total):
+        """Record page progress; also serves as the job's heartbeat."""
+        now = time.time()
+        with closing(self._connect()) as conn:
+            conn.execute('UPDATE jobs SET pages_done = ?, pages_total = ?, heartbeat_at = ?, updated_at = ? '
+                         'WHERE id = ?', (pages_done, pages_total, now, now, job_id))
+
+    def heartbeat(self, job_id):
+        """Mark a running job as alive."""
+        with closing(self._connect()) as conn:
+            conn.execute('UPDATE jobs SET heartbeat_at = ? WHERE id = ? AND status = ?',
+                         (time.time(), job_id, RUNNING))
+
+    def complete(self, job_id, result_path, mimetype, download_name):
+        """Mark a job as completed with its result file."""
+        now = time.time()
+        with closing(self._connect()) as conn:
+            conn.execute('UPDATE jobs SET status = ?, result_path = ?, result_mimetype = ?, result_name = ?, '
+                         'updated_at = ? WHERE id = ?',
+                         (COMPLETED, result_path, mimetype, download_name, now, job_id))
+
+    def fail(self, job_id, error):
+        """Mark a job as failed."""
+        with closing(self._connect()) as conn:
+            conn.execute('UPDATE jobs SET status = ?, error = ?, updated_at = ? WHERE id = ?',
+                         (FAILED, error, time.time(), job_id))
+
+    def purge(self, older_than):
+        """
+        Delete finished jobs last updated more than `older_than` seconds ago.
+
+        Returns:
+            list: Input paths of the purged jobs, so their files can be removed
+        """
+        cutoff = time.time() - older_than
+        with closing(self._connect()) as conn:
+            rows = conn.execute('SELECT id, input_path FROM jobs WHERE status IN (?, ?) AND updated_at < ?',
+                                (COMPLETED, FAILED, cutoff)).fetchall()
+            conn.executemany('DELETE FROM jobs WHERE id = ?', [(row['id'],) for row in rows])
+        return [row['input_path'] for row in rows]
+
+
+class JobRunner:
+    """
+    Local pool of worker threads that drain a JobStore.
+    """
+
+    def __init__(self, store, handler, workers=1, poll_interval=1.0, retention=24 * 60 * 60):
+        """
+        Args:
+            store (JobStore): The job queue
+            handler (callable): Called as handler(job, progress) and returns
+                (result_path, mimetype, download_name); progress(done, total) reports pages
+            workers (int): Number of worker threads
+            poll_interval (float): Seconds to wait when the queue is empty
+            retention (int): Seconds finished jobs and their files are kept
+        """
+        self.store = store
+        self.handler = handler
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self._threads = []
+        self._stop = threading.Event()
+
+    def start(self):
+        """Start the worker threads (idempotent)."""
+        if self._threads:
+            return
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f'job-worker-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info(f"Started {self.workers} job worker(s)")
+
+    def stop(self):
+        """Ask the worker threads to exit after their current job."""
+        self._stop.set()
+
+    def _work(self):
+        last_purge = 0
+        while not self._stop.is_set():
+            if time.time() - last_purge > 60:
+                self._purge()
+                last_purge = time.time()
+
+            try:
+                job = self.store.claim()
+            except sqlite3.Error as e:
+                logger.error(f"Error claiming job: {str(e)}")
+                job = None
+
+            if job is None:
+                self._stop.wait(self.poll_interval)
+                continue
+
+            self._run(job)
+
+    def _run(self, job):
+        job_id = job['id']
+        logger.info(f"Running job {job_id} (attempt {job['attempts'] + 1})")
+
+        # Keep the heartbeat fresh even while a single page takes a long time
+        done = threading.Event()
+
+        def beat():
+            while not done.wait(self.store.stale_after / 4):
+                self.store.heartbeat(job_id)
+
+        heartbeat_thread = threading.Thread(target=beat, daemon=True)
+        heartbeat_thread.start()
+
+        try:
+            result_path, mimetype, download_name = self.handler(
+                job, lambda pages_done, pages_total: self.store.update_progress(job_id, pages_done, pages_total))
+            self.store.complete(job_id, result_path, mimetype, download_name)
+            logger.info(f"Completed job {job_id}")
+        except Exception as e:
+            logger.error(f"Job {job_id} failed: {str(e)}")
+            self.store.fail(job_id, str(e))
+        finally:
+            done.set()
+
+    def _purge(self):
+        try:
+            for input_path in self.store.purge(self.retention):
+                shutil.rmtree(os.path.dirname(input_path), ignore_errors=True)
+        except sqlite3.Error as e:
+            logger.error(f"Error purging jobs: {str(e)}")
@@ -0,0 +1,112 @@
+import os
+import time
+
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram,
+                               generate_latest, multiprocess)
+from prometheus_client.core import GaugeMetricFamily
+
+# Under gunicorn every worker writes its samples to files in this directory,
+# and a scrape of any worker aggregates all of them
+MULTIPROCESS = bool(os.environ.get('PROMETHEUS_MULTIPROC_DIR'))
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+STEP_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+REQUESTS = Counter('preprocess_http_requests_total', 'HTTP requests handled',
+                   ['route', 'method', 'status'])
+REQUEST_LATENCY = Histogram('preprocess_http_request_duration_seconds',
+                            'Time from request to the end of the response body', ['route'],
+                            buckets=LATENCY_BUCKETS)
+IN_FLIGHT = Gauge('preprocess_http_requests_in_flight', 'Requests currently being handled',
+                  multiprocess_mode='livesum')
+BYTES_IN = Counter('preprocess_http_request_bytes_total', 'Bytes of request bodies received', ['route'])
+BYTES_OUT = Counter('preprocess_http_response_bytes_total', 'Bytes of response bodies sent', ['route'])
+
+STEP_LATENCY = Histogram('preprocess_step_duration_seconds', 'Wall time of each ImagePreprocessor step',
+                         ['step'], buckets=STEP_BUCKETS)
+PAGES = Counter('preprocess_pages_total', 'Images and PDF pages processed', ['cached'])
+CACHE_LOOKUPS = Counter('preprocess_cache_lookups_total', 'Result and page cache lookups', ['cache', 'result'])
+PDF_PAGE_COUNT = Histogram('preprocess_pdf_pages', 'Page count of uploaded PDFs',
+                           buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500, 1000))
+
+
+class DirectoryUsageCollector:
+    """Reports the disk usage of a directory tree when metrics are scraped."""
+
+    def __init__(self, name, description, directory):
+        self.name = name
+        self.description = description
+        self.directory = directory
+
+    def collect(self):
+        total = 0
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                try:
+                    total += os.lstat(os.path.join(root, name)).st_size
+                except OSError:
+                    # Removed by another request while walking
+                    pass
+        yield GaugeMetricFamily(self.name, self.description, value=total)
+
+
+def record_page(details):
+    """Count one processed image or page and observe the latency of its steps."""
+    cached = bool(details.get('cached'))
+    PAGES.labels(cached=str(cached).lower()).inc()
+    for record in details.get('timings', {}).get('steps', []):
+        STEP_LATENCY.labels(step=record['step']).observe(record['seconds'])
+
+
+def start_request():
+    """Mark a request as in flight; returns the start time for `finish_request`."""
+    IN_FLIGHT.inc()
+    return time.perf_counter()
+
+
+def finish_request(route, method, status, start, bytes_in, bytes_out):
+    """Record a request once its response body has been sent or abandoned."""
+    IN_FLIGHT.dec()
+    REQUESTS.labels(route=route, method=method, status=str(status)).inc()
+    REQUEST_LATENCY.labels(route=route).observe(time.perf_counter() - start)
+    BYTES_IN.labels(route=route).inc(bytes_in or 0)
+    BYTES_OUT.labels(route=route).inc(bytes_out)
+
+
+def count_bytes(iterable, counter):
+    """
+    Wrap a response body iterable, adding the size of every chunk to `counter[0]`.
+
+    The wrapped iterable is closed when the wrapper is, so streaming
+    generators still stop their work if the client disconnects.
+    """
+    try:
+        for chunk in iterable:
+            counter[0] += len(chunk)
+            yield chunk
+    finally:
+        close = getattr(iterable, 'close', None)
+        if close:
+            close()
+
+
+def render(collectors=()):
+    """
+    Render every metric in the Prometheus text exposition format.
+
+    Args:
+        collectors (list): Extra collectors evaluated at scrape time (e.g. disk usage)
+
+    Returns:
+        tuple: (body bytes, content type)
+    """
+    registry = CollectorRegistry()
+    if MULTIPROCESS:
+        multiprocess.MultiProcessCollector(registry)
+    for collector in collectors:
+        registry.register(collector)
+    body = generate_latest(registry)
+    if not MULTIPROCESS:
+        # A single process keeps its samples in the default registry
+        body = generate_latest(REGISTRY) + body
+    return body, CONTENT_TYPE_LATEST
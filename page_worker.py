@@ -0,0 +1,44 @@
+"""
+Work run by the page pool processes.
+
+Pool processes are started from a forkserver that preloads only this module,
+so nothing here may configure anything at import time: the pool initializer
+applies the process's resource limits, including its share of the cores.
+"""
+import time
+
+from preprocessing import ImagePreprocessor, configure_resource_limits
+
+
+def init_page_worker(limits):
+    """Pool initializer: apply the resource limits of a page pool process (keyword arguments of configure_resource_limits)"""
+    configure_resource_limits(**limits)
+
+
+def page_details(preprocessor, start):
+    """Summarize one processed image for progress events, including the cost of each step"""
+    return {
+        'cached': False,
+        'deskew_angle': preprocessor.skew_angle,
+        'width': preprocessor.image.width,
+        'height': preprocessor.image.height,
+        'timings': {'steps': preprocessor.collector.steps(), 'total': time.perf_counter() - start},
+    }
+
+
+def process_image(image_path, output_path, plan):
+    """Process a single image file with a compiled pipeline plan, returning its details"""
+    start = time.perf_counter()
+    preprocessor = ImagePreprocessor(image_path)
+    plan.run(preprocessor)
+    preprocessor.save(output_path, **plan.output.encoder_args())
+    return page_details(preprocessor, start)
+
+
+def process_blob(blob, plan):
+    """Process an in-memory image with a compiled pipeline plan, returning (encoded result, details)"""
+    start = time.perf_counter()
+    preprocessor = ImagePreprocessor.from_blob(blob)
+    plan.run(preprocessor)
+    output = preprocessor.to_blob(**plan.output.encoder_args())
+    return output, page_details(preprocessor, start)
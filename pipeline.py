@@ -0,0 +1,459 @@
+import os
+import json
+import math
+
+# Width of the downscaled proxy used for skew detection (0 detects at full resolution)
+DESKEW_PROXY_WIDTH = int(os.environ.get('DESKEW_PROXY_WIDTH', 0))
+
+
+class PipelineError(ValueError):
+    """Raised when a pipeline specification or one of its parameters is invalid."""
+
+
+class Param:
+    """
+    A typed, validated parameter of a pipeline step.
+    """
+
+    def __init__(self, key, arg, type, default, min_value=None, max_value=None, choices=None):
+        """
+        Args:
+            key (str): Name of the parameter in request params (e.g. 'denoise_level')
+            arg (str): Keyword argument passed to the ImagePreprocessor method
+            type (type): Type the value is converted to (int, float or str)
+            default: Value used when the request does not supply one
+            min_value: Smallest accepted value, if bounded
+            max_value: Largest accepted value, if bounded
+            choices (tuple): Accepted values, for parameters that select an option
+        """
+        self.key = key
+        self.arg = arg
+        self.type = type
+        self.default = default
+        self.min_value = min_value
+        self.max_value = max_value
+        self.choices = choices
+
+    def parse(self, value):
+        """
+        Convert and validate a raw value (from JSON or a form field).
+
+        Returns:
+            The converted value
+
+        Raises:
+            PipelineError: If the value has the wrong type or is out of range
+        """
+        if isinstance(value, bool):
+            raise PipelineError(f"Invalid value for '{self.key}': {value!r}")
+        if self.type is int and isinstance(value, float) and not value.is_integer():
+            # int() would silently truncate JSON floats such as 2.9
+            raise PipelineError(f"Invalid value for '{self.key}': expected int, got {value!r}")
+        try:
+            converted = self.type(value)
+        except (TypeError, ValueError, OverflowError):
+            raise PipelineError(f"Invalid value for '{self.key}': expected {self.type.__name__}, got {value!r}")
+        if isinstance(converted, float) and not math.isfinite(converted):
+            # NaN passes every bound (comparisons with it are false) and inf reaches ImageMagick
+            raise PipelineError(f"'{self.key}' must be a finite number, got {value!r}")
+
+        if self.min_value is not None and converted < self.min_value:
+            raise PipelineError(f"'{self.key}' must be >= {self.min_value}, got {converted}")
+        if self.max_value is not None and converted > self.max_value:
+            raise PipelineError(f"'{self.key}' must be <= {self.max_value}, got {converted}")
+        if self.choices is not None and converted not in self.choices:
+            raise PipelineError(f"'{self.key}' must be one of {', '.join(map(str, self.choices))}, got {converted!r}")
+        return converted
+
+
+class Step:
+    """
+    A registered pipeline step: an ImagePreprocessor method plus its parameters.
+    """
+
+    def __init__(self, name, method, params=(), gray_safe=False, outputs_gray=False):
+        """
+        Args:
+            name (str): Step name used in requests (e.g. 'enhance')
+            method (str): Name of the ImagePreprocessor method to call
+            params (list): Param objects accepted by the step
+            gray_safe (bool): The step gives the same result for OCR whether it runs
+                on the color image or on its grayscale conversion
+            outputs_gray (bool): The step always leaves a grayscale image, so color
+                is not needed by anything before it
+        """
+        self.name = name
+        self.method = method
+        self.params = list(params)
+        self.gray_safe = gray_safe
+        self.outputs_gray = outputs_gray
+
+
+# Registry of available steps, keyed by step name
+STEPS = {}
+
+
+def register_step(step):
+    """Register a step so it can be used in pipelines and presets."""
+    STEPS[step.name] = step
+    return step
+
+
+register_step(Step('deskew', 'deskew', [
+    Param('deskew_max_angle', 'max_angle', float, 10, min_value=0, max_value=45),
+    Param('deskew_proxy_width', 'proxy_width', int, DESKEW_PROXY_WIDTH, min_value=0),
+], gray_safe=True))
+register_step(Step('denoise', 'denoise', [
+    Param('denoise_level', 'level', int, 1, min_value=1, max_value=3),
+], gray_safe=True))
+register_step(Step('binarize', 'binarize', [
+    Param('binarize_method', 'method', str, 'fixed', choices=('fixed', 'otsu', 'sauvola')),
+    Param('binarize_threshold', 'threshold', int, 128, min_value=0, max_value=255),
+    Param('binarize_window', 'window', int, 25, min_value=3, max_value=255),
+    Param('binarize_k', 'k', float, 0.2, min_value=0, max_value=1),
+], gray_safe=True, outputs_gray=True))
+register_step(Step('enhance', 'enhance_contrast', [
+    Param('enhance_factor', 'factor', float, 2.0, min_value=0),
+], gray_safe=True))
+register_step(Step('resize', 'resize', [
+    Param('resize_scale', 'scale_factor', float, 2.0, min_value=0.1, max_value=4.0),
+], gray_safe=True))
+register_step(Step('sharpen', 'sharpen', [
+    Param('sharpen_radius', 'radius', float, 0, min_value=0, max_value=20),
+    Param('sharpen_sigma', 'sigma', float, 1.0, min_value=0, max_value=20),
+], gray_safe=True))
+# Trimming margins first shrinks the pixel count for every later step
+register_step(Step('remove_borders', 'remove_borders', [
+    Param('border_fuzz', 'fuzz', int, 10, min_value=0, max_value=100),
+], gray_safe=True))
+
+DEFAULT_STEPS = ['deskew', 'denoise', 'binarize', 'enhance']
+
+
+def plan_colorspace(steps):
+    """
+    Choose the colorspace a pipeline can work in from load onwards.
+
+    When a step discards color and every step before it works as well on
+    grayscale, the color channels are never needed: the image is converted
+    to 8-bit gray once when it is loaded (PDF pages are rasterized as gray
+    directly), instead of each step doing its own grayscale pass over
+    three channels.
+
+    Args:
+        steps (list): Step names in execution order
+
+    Returns:
+        str: 'gray' or 'rgb'
+    """
+    for name in steps:
+        step = STEPS[name]
+        if not step.gray_safe:
+            return 'rgb'
+        if step.outputs_gray:
+            return 'gray'
+    return 'rgb'
+
+
+# Supported output formats: format name -> (file extension, mimetype)
+OUTPUT_FORMATS = {
+    'png': ('png', 'image/png'),
+    'tiff': ('tif', 'image/tiff'),
+    'webp': ('webp', 'image/webp'),
+    'jpeg': ('jpg', 'image/jpeg'),
+}
+
+# Formats that only store 8 bits per channel
+EIGHT_BIT_FORMATS = ('webp', 'jpeg')
+
+# How the pages of a PDF are packaged: container name -> (download name, mimetype)
+OUTPUT_CONTAINERS = {
+    'zip': ('processed_images.zip', 'application/zip'),
+    'tiff': ('processed_pages.tif', 'image/tiff'),
+    'pdf': ('processed_pages.pdf', 'application/pdf'),
+}
+
+
+class OutputSpec:
+    """
+    How processed images are encoded.
+
+    Bilevel results are written compactly unless a bit depth is requested:
+    1-bit PNG, or CCITT Group 4 when TIFF is requested. WebP output is
+    always lossless; JPEG is the only lossy format.
+
+    The container only applies to PDF input: a ZIP of page images, one
+    multi-page TIFF, or an image-only PDF.
+    """
+
+    def __init__(self, format='png', compression=None, quality=90, bit_depth=None, strip=False,
+                 container='zip'):
+        """
+        Args:
+            format (str): Output format, one of OUTPUT_FORMATS
+            compression (int): Compression effort from 0 (fastest) to 9 (smallest)
+                for PNG, TIFF and WebP; the encoder default if None
+            quality (int): JPEG quality from 1 to 100
+            bit_depth (int): Bits per channel, 8 or 16; chosen automatically if None
+            strip (bool): Drop metadata and color profiles from the output
+            container (str): How PDF pages are packaged, one of OUTPUT_CONTAINERS
+        """
+        if format not in OUTPUT_FORMATS:
+            raise PipelineError(f"Unknown output format: {format}. "
+                                f"Available formats: {', '.join(sorted(OUTPUT_FORMATS))}")
+        if bit_depth is not None and format in EIGHT_BIT_FORMATS and bit_depth != 8:
+            raise PipelineError(f"Output format '{format}' only supports a bit depth of 8")
+        if container not in OUTPUT_CONTAINERS:
+            raise PipelineError(f"Unknown output container: {container}. "
+                                f"Available containers: {', '.join(sorted(OUTPUT_CONTAINERS))}")
+        if container == 'tiff' and format != 'tiff':
+            raise PipelineError("The tiff container requires output_format=tiff")
+        self.format = format
+        self.compression = compression
+        self.quality = quality
+        self.bit_depth = bit_depth
+        self.strip = strip
+        self.container = container
+
+    @property
+    def extension(self):
+        return OUTPUT_FORMATS[self.format][0]
+
+    @property
+    def mimetype(self):
+        return OUTPUT_FORMATS[self.format][1]
+
+    @property
+    def container_name(self):
+        return OUTPUT_CONTAINERS[self.container][0]
+
+    @property
+    def container_mimetype(self):
+        return OUTPUT_CONTAINERS[self.container][1]
+
+    def encoder_args(self):
+        """Keyword arguments for `ImagePreprocessor.save` and `to_blob`."""
+        return {'format': self.format, 'compression': self.compression, 'quality': self.quality,
+                'bit_depth': self.bit_depth, 'strip': self.strip}
+
+    def to_dict(self):
+        return dict(self.encoder_args(), container=self.container)
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**data)
+
+
+# Request form fields describing the output, parsed like step parameters
+OUTPUT_PARAMS = [
+    Param('output_compression', 'compression', int, None, min_value=0, max_value=9),
+    Param('output_quality', 'quality', int, 90, min_value=1, max_value=100),
+    Param('output_bit_depth', 'bit_depth', int, None, min_value=8, max_value=16),
+]
+
+
+def parse_output(form):
+    """
+    Build the output spec from the `output_*` fields of a request form.
+
+    Raises:
+        PipelineError: If the format or one of the options is not supported
+    """
+    kwargs = {}
+    for param in OUTPUT_PARAMS:
+        value = form.get(param.key)
+        kwargs[param.arg] = param.parse(value) if value not in (None, '') else param.default
+    if kwargs['bit_depth'] not in (None, 8, 16):
+        raise PipelineError(f"'output_bit_depth' must be 8 or 16, got {kwargs['bit_depth']}")
+    strip = (form.get('output_strip') or '').lower() in ('1', 'true', 'yes', 'on')
+    container = (form.get('output_container') or 'zip').lower()
+    # Pages of a multi-page TIFF are TIFFs themselves
+    default_format = 'tiff' if container == 'tiff' else 'png'
+    return OutputSpec(format=(form.get('output_format') or default_format).lower(), strip=strip,
+                      container=container, **kwargs)
+
+
+class Plan:
+    """
+    A compiled, validated pipeline: an ordered list of preprocessor calls.
+
+    Plans hold only plain data, so they can be pickled to worker processes.
+    """
+
+    def __init__(self, calls, output=None, colorspace='rgb'):
+        """
+        Args:
+            calls (list): (step name, method name, kwargs) tuples in execution order
+            output (OutputSpec): How results are encoded (PNG by default)
+            colorspace (str): 'gray' to convert images to 8-bit gray before the first step
+        """
+        self.calls = calls
+        self.output = output or OutputSpec()
+        self.colorspace = colorspace
+
+    @property
+    def steps(self):
+        """Names of the steps in execution order."""
+        return [name for name, _, _ in self.calls]
+
+    def run(self, preprocessor):
+        """
+        Apply every step of the plan to a loaded preprocessor.
+
+        Images are converted to gray first when the plan's colorspace is 'gray'.
+
+        Returns:
+            list: The records of the preprocessor's collector for each step, in order
+        """
+        first = len(preprocessor.collector.records)
+        if self.colorspace == 'gray':
+            preprocessor.to_grayscale()
+        for _, method, kwargs in self.calls:
+            getattr(preprocessor, method)(**kwargs)
+        return [record for record in preprocessor.collector.records[first:] if record['depth'] == 0]
+
+    def to_dict(self):
+        """Return a JSON-serializable description of the plan."""
+        return {'steps': [{'step': name, 'params': kwargs} for name, _, kwargs in self.calls],
+                'output': self.output.to_dict(),
+                'colorspace': self.colorspace}
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Rebuild a plan from the output of `to_dict`, e.g. after storing it.
+
+        Raises:
+            PipelineError: If a step is no longer registered
+        """
+        calls = []
+        for entry in data['steps']:
+            if entry['step'] not in STEPS:
+                raise PipelineError(f"Unknown step: {entry['step']}")
+            calls.append((entry['step'], STEPS[entry['step']].method, dict(entry['params'])))
+        return cls(calls, output=OutputSpec.from_dict(data.get('output', {})),
+                   colorspace=data.get('colorspace', 'rgb'))
+
+
+def compile_pipeline(steps=None, params=None, output=None):
+    """
+    Validate a list of steps and their parameters and compile them into a Plan.
+
+    Args:
+        steps (list): Step names in execution order (the default pipeline if empty)
+        params (dict): Parameter values keyed by parameter key (e.g. 'denoise_level')
+        output (OutputSpec): How results are encoded (PNG by default)
+
+    Returns:
+        Plan: The compiled plan
+
+    Raises:
+        PipelineError: If a step is unknown or a parameter is invalid
+    """
+    steps = list(steps) if steps else list(DEFAULT_STEPS)
+    params = params or {}
+    if not isinstance(params, dict):
+        raise PipelineError("Pipeline params must be a JSON object")
+
+    unknown_steps = [name for name in steps if name not in STEPS]
+    if unknown_steps:
+        raise PipelineError(f"Unknown step(s): {', '.join(unknown_steps)}. "
+                            f"Available steps: {', '.join(sorted(STEPS))}")
+
+    known_keys = {param.key for step in STEPS.values() for param in step.params}
+    unknown_keys = sorted(set(params) - known_keys)
+    if unknown_keys:
+        raise PipelineError(f"Unknown parameter(s): {', '.join(unknown_keys)}")
+
+    calls = []
+    for name in steps:
+        step = STEPS[name]
+        kwargs = {}
+        for param in step.params:
+            value = params.get(param.key, param.default)
+            kwargs[param.arg] = param.parse(value)
+        calls.append((name, step.method, kwargs))
+
+    return Plan(calls, output=output, colorspace=plan_colorspace(steps))
+
+
+def parse_params(raw):
+    """
+    Parse the JSON `params` form field of a pipeline request.
+
+    Raises:
+        PipelineError: If the field is not a valid JSON object
+    """
+    if not raw:
+        return {}
+    try:
+        params = json.loads(raw)
+    except ValueError as e:
+        raise PipelineError(f"Invalid params JSON: {str(e)}")
+    if not isinstance(params, dict):
+        raise PipelineError("Pipeline params must be a JSON object")
+    return params
+
+
+class Preset:
+    """
+    A named pipeline exposed as an endpoint, with its own form fields and defaults.
+    """
+
+    def __init__(self, name, steps, form_fields=None, defaults=None):
+        """
+        Args:
+            name (str): Preset name
+            steps (list): Step names in execution order
+            form_fields (dict): Maps endpoint form field names to parameter keys
+            defaults (dict): Parameter values that override the step defaults
+        """
+        self.name = name
+        self.steps = list(steps)
+        self.form_fields = form_fields or {}
+        self.defaults = defaults or {}
+
+    def compile(self, form):
+        """
+        Compile the preset with parameter values taken from a request form.
+
+        Raises:
+            PipelineError: If a form value is invalid
+        """
+        params = dict(self.defaults)
+        for field, key in self.form_fields.items():
+            value = form.get(field)
+            if value not in (None, ''):
+                params[key] = value
+        return compile_pipeline(self.steps, params, output=parse_output(form))
+
+
+PRESETS = {
+    'default': Preset('default', DEFAULT_STEPS),
+    'binarize': Preset('binarize', ['binarize'], form_fields={'method': 'binarize_method',
+                                                            'threshold': 'binarize_threshold',
+                                                            'window': 'binarize_window',
+                                                            'k': 'binarize_k'}),
+    'deskew': Preset('deskew', ['deskew']),
+    'denoise': Preset('denoise', ['denoise'], form_fields={'level': 'denoise_level'}),
+    'enhance': Preset('enhance', ['enhance'], form_fields={'factor': 'enhance_factor'}),
+    # Google Vision: deskew → enhance → denoise, with lighter enhancement
+    'google_vision': Preset('google_vision', ['deskew', 'enhance', 'denoise'],
+                            form_fields={'enhance_factor': 'enhance_factor',
+                                         'denoise_level': 'denoise_level'},
+                            defaults={'enhance_factor': 1.5, 'denoise_level': 1}),
+}
+
+
+def compile_request(form):
+    """
+    Compile the custom pipeline described by a `/api/preprocess/pipeline` form.
+
+    The form carries repeated `steps` fields, an optional JSON `params` field
+    and an optional `output_format`.
+
+    Raises:
+        PipelineError: If the specification is invalid
+    """
+    return compile_pipeline(form.getlist('steps'), parse_params(form.get('params')),
+                            output=parse_output(form))
@@ -1,61 +1,342 @@
-from wand.image import Image
+from wand.api import library
+from wand.image import Image, STORAGE_TYPES
 from wand.color import Color
+from wand.exceptions import ResourceLimitError
+from wand.resource import limits
+import numpy as np
 import os
 import math
 import logging
+from instrumentation import StepCollector, instrumented
+from thresholds import otsu_threshold, sauvola_thresholds
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# NumPy dtypes that pixels can be exchanged as -> ImageMagick storage type.
+# Float values are normalized to 0.0-1.0.
+PIXEL_STORAGE = {
+    np.dtype(np.uint8): 'char',
+    np.dtype(np.uint16): 'short',
+    np.dtype(np.uint32): 'integer',
+    np.dtype(np.float32): 'float',
+    np.dtype(np.float64): 'double',
+}
+
+# Largest image, in pixels, that is decoded at all (0 for no limit); see configure_resource_limits
+_max_pixels = 0
+
+class ImageTooLargeError(ValueError):
+    """Raised when an input image exceeds the configured size or resource limits."""
+
+def configure_resource_limits(memory=0, map=0, disk=0, area=0, width=0, height=0, thread=0, max_pixels=0):
+    """
+    Apply ImageMagick resource limits to this process.
+    
+    Pixel caches beyond `memory` bytes are memory-mapped up to `map` bytes,
+    then spill to disk up to `disk` bytes; exceeding the disk budget, `width`
+    or `height` raises an error instead of exhausting the machine. Every
+    process enforces its own limits, so a host's worst case is the budget
+    times the number of worker processes.
+    
+    Args:
+        memory (int): Bytes of heap for pixel caches
+        map (int): Bytes of memory-mapped pixel caches
+        disk (int): Bytes of disk-backed pixel caches
+        area (int): Pixels an image may have before its cache goes to disk
+        width (int): Largest accepted image width
+        height (int): Largest accepted image height
+        thread (int): OpenMP threads used by each operation
+        max_pixels (int): Largest accepted width * height, checked before decoding
+    
+    A value of 0 keeps ImageMagick's (or policy.xml's) default.
+    """
+    global _max_pixels
+    for resource, value in (('memory', memory), ('map', map), ('disk', disk), ('area', area),
+                            ('width', width), ('height', height), ('thread', thread)):
+        if value:
+            limits[resource] = value
+    _max_pixels = max_pixels
+    logger.info("ImageMagick resource limits: " +
+                ", ".join(f"{resource}={limits[resource]}" for resource in
+                          ('memory', 'map', 'disk', 'area', 'width', 'height', 'thread')))
+
+def reraise_resource_errors(error):
+    """
+    Re-raise an error caught by a step if it means the process ran out of resources.
+    
+    Steps log and skip most errors, but an image that exhausts the resource
+    limits must fail the request rather than be returned half-processed.
+    """
+    if isinstance(error, (ResourceLimitError, MemoryError)):
+        raise error
+
+def set_thread_limit(threads):
+    """Set how many OpenMP threads each ImageMagick operation in this process may use."""
+    if threads:
+        limits['thread'] = threads
+
+def open_image(filename=None, blob=None, format=None):
+    """
+    Decode an image, rejecting it cleanly if it exceeds the resource limits.
+    
+    The header is pinged first, so an oversized image (e.g. a decompression
+    bomb) is refused before any pixels are allocated.
+    
+    Raises:
+        ImageTooLargeError: If the image is too large to decode within the limits
+    """
+    try:
+        if _max_pixels:
+            with Image.ping(filename=filename, blob=blob, format=format) as header:
+                if header.width * header.height > _max_pixels:
+                    raise ImageTooLargeError(f"Image is {header.width}x{header.height} pixels, "
+                                             f"more than the limit of {_max_pixels} pixels")
+        return Image(filename=filename, blob=blob, format=format)
+    except ResourceLimitError as e:
+        raise ImageTooLargeError(f"Image exceeds the resource limits: {str(e)}") from e
+
 class ImagePreprocessor:
     """
     A class for preprocessing images to improve OCR accuracy using ImageMagick via Wand.
     """
     
-    def __init__(self, image_path):
+    def __init__(self, image_path, collector=None):
         """
         Initialize the preprocessor with an image path.
         
         Args:
             image_path (str): Path to the input image
+            collector (StepCollector): Records the cost of each step (a new one if omitted)
         """
         if not os.path.exists(image_path):
             raise FileNotFoundError(f"Image file not found: {image_path}")
         
         self.image_path = image_path
-        self.image = Image(filename=image_path)
+        self.image = open_image(filename=image_path)
+        self.skew_angle = None
+        self.collector = collector or StepCollector()
         logger.info(f"Loaded image: {image_path} ({self.image.width}x{self.image.height})")
     
-    def deskew(self, max_angle=10):
+    @classmethod
+    def from_blob(cls, blob, format=None, collector=None):
+        """
+        Initialize the preprocessor from encoded image bytes, without touching disk.
+        
+        Args:
+            blob (bytes): Encoded image data (PNG, JPEG, TIFF, ...)
+            format (str): Optional format hint for data without a recognizable header
+            collector (StepCollector): Records the cost of each step (a new one if omitted)
+        
+        Returns:
+            ImagePreprocessor: A preprocessor holding the decoded image
+        """
+        if not blob:
+            raise ValueError("Image data is empty")
+        
+        preprocessor = cls.__new__(cls)
+        preprocessor.image_path = None
+        preprocessor.image = open_image(blob=blob, format=format)
+        preprocessor.skew_angle = None
+        preprocessor.collector = collector or StepCollector()
+        logger.info(f"Loaded image from blob ({preprocessor.image.width}x{preprocessor.image.height})")
+        return preprocessor
+    
+    @classmethod
+    def from_stream(cls, stream, format=None, collector=None):
+        """
+        Initialize the preprocessor from a readable binary file object.
+        
+        Args:
+            stream: File-like object opened in binary mode
+            format (str): Optional format hint for data without a recognizable header
+            collector (StepCollector): Records the cost of each step (a new one if omitted)
+        
+        Returns:
+            ImagePreprocessor: A preprocessor holding the decoded image
+        """
+        return cls.from_blob(stream.read(), format=format, collector=collector)
+    
+    def to_numpy(self, channels=None, dtype=np.uint8):
+        """
+        Copy the pixels into a new NumPy array.
+        
+        ImageMagick writes the pixels straight into the array's buffer, so
+        this is a single copy with no intermediate Python objects.
+        
+        Args:
+            channels (str): Channel map, e.g. 'I' (intensity), 'RGB' or 'RGBA';
+                'I' for grayscale images and 'RGB' otherwise if omitted
+            dtype: uint8, uint16, uint32, float32 or float64 (floats in 0.0-1.0)
+        
+        Returns:
+            numpy.ndarray: (height, width) for a single channel, else (height, width, channels)
+        """
+        dtype = np.dtype(dtype)
+        if dtype not in PIXEL_STORAGE:
+            raise ValueError(f"Unsupported pixel dtype: {dtype}")
+        channels = (channels or ('I' if self.image.colorspace == 'gray' else 'RGB')).upper()
+        
+        width, height = self.image.width, self.image.height
+        shape = (height, width) if len(channels) == 1 else (height, width, len(channels))
+        array = np.empty(shape, dtype=dtype)
+        if not library.MagickExportImagePixels(self.image.wand, 0, 0, width, height, channels.encode('ascii'),
+                                               STORAGE_TYPES.index(PIXEL_STORAGE[dtype]),
+                                               array.ctypes.data):
+            self.image.raise_exception()
+        return array
+    
+    def from_numpy(self, array, channels=None):
+        """
+        Replace the pixels with the contents of a NumPy array.
+        
+        When the array has the image's size the pixels are imported in place,
+        keeping the image's metadata; otherwise a new image is created.
+        A single-channel array makes the image grayscale.
+        
+        Args:
+            array (numpy.ndarray): (height, width) or (height, width, channels) pixels,
+                of a dtype accepted by `to_numpy`
+            channels (str): Channel map of the array ('I', 'RGB' or 'RGBA' by shape if omitted)
+        """
+        if array.dtype not in PIXEL_STORAGE:
+            raise ValueError(f"Unsupported pixel dtype: {array.dtype}")
+        if array.ndim not in (2, 3):
+            raise ValueError(f"Expected a 2D or 3D array, got shape {array.shape}")
+        
+        height, width = array.shape[:2]
+        depth = 1 if array.ndim == 2 else array.shape[2]
+        channels = (channels or {1: 'I', 3: 'RGB', 4: 'RGBA'}.get(depth, '')).upper()
+        if len(channels) != depth:
+            raise ValueError(f"Channel map {channels!r} does not match an array with {depth} channel(s)")
+        # Only copies when the array is a non-contiguous view
+        array = np.ascontiguousarray(array)
+        
+        if (width, height) != (self.image.width, self.image.height):
+            resolution = self.image.resolution
+            self.image.close()
+            self.image = Image(width=width, height=height, background=Color('white'))
+            self.image.resolution = resolution
+        if channels == 'I':
+            self.image.transform_colorspace('gray')
+        elif self.image.colorspace == 'gray':
+            self.image.transform_colorspace('srgb')
+        if 'A' in channels:
+            self.image.alpha_channel = 'activate'
+        
+        if not library.MagickImportImagePixels(self.image.wand, 0, 0, width, height, channels.encode('ascii'),
+                                               STORAGE_TYPES.index(PIXEL_STORAGE[array.dtype]),
+                                               array.ctypes.data):
+            self.image.raise_exception()
+    
+    @instrumented
+    def to_grayscale(self):
+        """
+        Convert the image to single-channel 8-bit gray, for pipelines that never need color.
+        
+        Every later step then works on one channel instead of three (or four
+        with alpha), which cuts the pixel cache and the work per pixel.
+        Images that are already 8-bit gray, such as PDF pages rasterized in
+        gray, are left untouched.
+        
+        Returns:
+            self: For method chaining
+        """
+        try:
+            if self.image.alpha_channel:
+                # Flatten onto the background so transparent areas do not turn black
+                self.image.alpha_channel = 'remove'
+            if self.image.colorspace != 'gray':
+                self.image.transform_colorspace('gray')
+            if self.image.depth != 8:
+                self.image.depth = 8
+            logger.info("Converted image to 8-bit grayscale")
+        except Exception as e:
+            reraise_resource_errors(e)
+            logger.error(f"Error during grayscale conversion: {str(e)}")
+        
+        return self
+    
+    @instrumented
+    def estimate_skew_angle(self, proxy_width=None):
+        """
+        Estimate the skew angle of the image without modifying it.
+        
+        The angle is detected once on a grayscale clone and read back from
+        ImageMagick's `deskew:angle` artifact. Skew is scale-invariant, so the
+        clone can be downscaled to `proxy_width` first to make detection much
+        cheaper on large pages.
+        
+        Args:
+            proxy_width (int): Width to downscale to before detection (None for full resolution)
+        
+        Returns:
+            float: Detected skew angle in degrees, or None if it could not be determined
+        """
+        with self.image.clone() as temp:
+            if proxy_width and temp.width > proxy_width:
+                proxy_height = max(1, int(temp.height * proxy_width / temp.width))
+                temp.resize(proxy_width, proxy_height, filter='box')
+            if temp.colorspace != 'gray':
+                temp.type = 'grayscale'
+            temp.deskew(threshold=0.4 * temp.quantum_range)
+            angle = temp.artifacts.get('deskew:angle')
+        
+        return float(angle) if angle is not None else None
+    
+    @instrumented
+    def rotate(self, angle):
+        """
+        Rotate the image by a known angle, filling exposed corners with the background color.
+        
+        Args:
+            angle (float): Rotation angle in degrees (positive is clockwise)
+        
+        Returns:
+            self: For method chaining
+        """
+        self.image.rotate(angle, background=self.image.background_color)
+        return self
+    
+    @instrumented
+    def deskew(self, max_angle=10, proxy_width=None):
         """
         Deskew the image to straighten text.
         
+        The skew angle is estimated once and then applied directly with a
+        rotation, instead of letting a second full deskew detect it again.
+        
         Args:
             max_angle (int): Maximum rotation angle in degrees
+            proxy_width (int): Estimate the angle on a copy downscaled to this width
+                and apply it to the full-resolution image (None for full resolution)
         
         Returns:
             self: For method chaining
         """
         try:
-            # Convert to grayscale for better deskew detection
-            with self.image.clone() as temp:
-                temp.type = 'grayscale'
-                # Get skew angle
-                angle = temp.deskew(threshold=0.4 * temp.quantum_range)
-                
-                # Only deskew if the angle is within reasonable bounds
-                if angle and abs(angle) <= max_angle:
-                    logger.info(f"Deskewing image by {angle} degrees")
-                    self.image.deskew(threshold=0.4 * self.image.quantum_range)
-                else:
-                    logger.info("No deskewing needed or angle too extreme")
+            angle = self.estimate_skew_angle(proxy_width=proxy_width)
+            self.skew_angle = angle
+            
+            if angle is None:
+                # Older ImageMagick builds do not report the angle; fall back to a full deskew
+                logger.info("Skew angle unavailable, running full deskew")
+                self.image.deskew(threshold=0.4 * self.image.quantum_range)
+            # Only deskew if the angle is within reasonable bounds
+            elif angle and abs(angle) <= max_angle:
+                logger.info(f"Deskewing image by {angle} degrees")
+                self.rotate(angle)
+            else:
+                logger.info("No deskewing needed or angle too extreme")
         except Exception as e:
+            reraise_resource_errors(e)
             logger.error(f"Error during deskew: {str(e)}")
             # Continue without deskewing if there's an error
         
         return self
     
+    @instrumented
     def denoise(self, level=1):
         """
         Remove noise from the image.
@@ -81,32 +362,59 @@ class ImagePreprocessor:
             
             logger.info(f"Applied noise reduction at level {level}")
         except Exception as e:
+            reraise_resource_errors(e)
             logger.error(f"Error during denoise: {str(e)}")
         
         return self
     
-    def binarize(self, threshold=128):
+    @instrumented
+    def binarize(self, threshold=128, method='fixed', window=25, k=0.2):
         """
         Binarize the image (convert to black and white).
         
         Args:
-            threshold (int): Threshold value (0-255)
+            threshold (int): Threshold value (0-255) for the 'fixed' method
+            method (str): 'fixed' for a global threshold, 'otsu' for a global threshold
+                computed from the histogram, or 'sauvola' for a local threshold per pixel
+                (for uneven lighting, e.g. phone photos)
+            window (int): Side of the Sauvola neighbourhood in pixels (made odd)
+            k (float): Sauvola sensitivity to local contrast
         
         Returns:
             self: For method chaining
         """
         try:
-            # Convert to grayscale first
-            self.image.type = 'grayscale'
+            if method == 'fixed':
+                # Convert to grayscale first, unless the pipeline already did at load
+                if self.image.colorspace != 'gray':
+                    self.image.type = 'grayscale'
+                
+                # Apply threshold
+                self.image.threshold(threshold / 255.0 * self.image.quantum_range)
+                logger.info(f"Binarized image with threshold {threshold}")
+                return self
             
-            # Apply threshold
-            self.image.threshold(threshold / 255.0 * self.image.quantum_range)
-            logger.info(f"Binarized image with threshold {threshold}")
+            gray = self.to_numpy(channels='I')
+            if method == 'otsu':
+                threshold = otsu_threshold(gray)
+                binary = (gray > threshold).astype(np.uint8)
+                description = f"Otsu threshold {threshold}"
+            elif method == 'sauvola':
+                binary = (gray > sauvola_thresholds(gray, window, k)).astype(np.uint8)
+                description = f"Sauvola window={window}, k={k}"
+            else:
+                raise ValueError(f"Unknown binarization method: {method}")
+            del gray
+            binary *= 255
+            self.from_numpy(binary)
+            logger.info(f"Binarized image with {description}")
         except Exception as e:
+            reraise_resource_errors(e)
             logger.error(f"Error during binarization: {str(e)}")
         
         return self
     
+    @instrumented
     def enhance_contrast(self, factor=2.0):
         """
         Enhance contrast to make text more visible.
@@ -133,10 +441,12 @@ class ImagePreprocessor:
             
             logger.info(f"Enhanced contrast with factor {factor}")
         except Exception as e:
+            reraise_resource_errors(e)
             logger.error(f"Error during contrast enhancement: {str(e)}")
         
         return self
     
+    @instrumented
     def resize(self, scale_factor=2.0):
         """
         Resize the image to improve OCR accuracy.
@@ -157,10 +467,12 @@ class ImagePreprocessor:
             self.image.resize(new_width, new_height, filter='lanczos')
             logger.info(f"Resized image from {original_width}x{original_height} to {new_width}x{new_height}")
         except Exception as e:
+            reraise_resource_errors(e)
             logger.error(f"Error during resize: {str(e)}")
         
         return self
     
+    @instrumented
     def sharpen(self, radius=0, sigma=1.0):
         """
         Sharpen the image to make text more defined.
@@ -176,10 +488,12 @@ class ImagePreprocessor:
             self.image.sharpen(radius=radius, sigma=sigma)
             logger.info(f"Sharpened image with radius={radius}, sigma={sigma}")
         except Exception as e:
+            reraise_resource_errors(e)
             logger.error(f"Error during sharpening: {str(e)}")
         
         return self
     
+    @instrumented
     def remove_borders(self, fuzz=10):
         """
         Remove borders from the image.
@@ -191,26 +505,115 @@ class ImagePreprocessor:
             self: For method chaining
         """
         try:
+            original_width = self.image.width
+            original_height = self.image.height
+            
             # Convert fuzz percentage to quantum range
             fuzz_value = fuzz / 100.0 * self.image.quantum_range
             self.image.trim(color=None, fuzz=fuzz_value)
-            logger.info(f"Removed borders with fuzz={fuzz}")
+            # Drop the virtual canvas offset left by trim so later steps see a plain image
+            self.image.reset_coords()
+            logger.info(f"Removed borders with fuzz={fuzz} "
+                        f"({original_width}x{original_height} -> {self.image.width}x{self.image.height})")
         except Exception as e:
+            reraise_resource_errors(e)
             logger.error(f"Error during border removal: {str(e)}")
         
         return self
     
-    def save(self, output_path):
+    def is_bilevel(self):
+        """
+        Check whether the image holds only pure black and white pixels.
+        
+        Only grayscale images are inspected, so color images are rejected
+        without counting their colors.
+        
+        Returns:
+            bool: True if the image can be stored as 1 bit per pixel
+        """
+        try:
+            if self.image.colorspace != 'gray' or self.image.colors > 2:
+                return False
+            return all(color.red_int8 in (0, 255) for color in self.image.histogram)
+        except Exception as e:
+            reraise_resource_errors(e)
+            logger.error(f"Error checking for bilevel image: {str(e)}")
+            return False
+    
+    def _prepare_output(self, format, compression=None, quality=90, bit_depth=None, strip=False):
+        """
+        Set encoder options for the output format.
+        
+        Bilevel results are stored as 1-bit PNG or CCITT Group 4 TIFF, which is
+        an order of magnitude smaller than the default 8/16-bit grayscale,
+        unless an explicit bit depth is requested.
+        
+        Args:
+            format (str): Output format (png, tiff, webp or jpeg)
+            compression (int): Effort from 0 (fastest) to 9 (smallest) for lossless formats
+            quality (int): JPEG quality from 1 to 100
+            bit_depth (int): Bits per channel, or None to keep the image's depth
+            strip (bool): Drop metadata and color profiles
+        """
+        format = (format or '').lower()
+        if format == 'tif':
+            format = 'tiff'
+        elif format == 'jpg':
+            format = 'jpeg'
+        
+        if strip:
+            self.image.strip()
+        
+        if bit_depth is None and format in ('png', 'tiff') and self.is_bilevel():
+            self.image.type = 'bilevel'
+            if format == 'png':
+                self.image.options['png:bit-depth'] = '1'
+                self.image.options['png:color-type'] = '0'
+            else:
+                self.image.compression = 'group4'
+            logger.info(f"Writing bilevel image as 1-bit {format}")
+            return
+        
+        if bit_depth is not None:
+            self.image.depth = bit_depth
+        
+        if format == 'png' and compression is not None:
+            # Tens digit is the zlib level, units digit 5 selects adaptive filtering
+            self.image.compression_quality = compression * 10 + 5
+        elif format == 'tiff':
+            if compression is None:
+                self.image.compression = 'lzw'
+            elif compression == 0:
+                self.image.compression = 'no'
+            else:
+                # Deflate, with the zlib level taken from quality / 10
+                self.image.compression = 'zip'
+                self.image.compression_quality = compression * 10
+        elif format == 'webp':
+            self.image.options['webp:lossless'] = 'true'
+            if compression is not None:
+                self.image.options['webp:method'] = str(round(compression * 6 / 9))
+        elif format == 'jpeg':
+            self.image.compression_quality = quality
+    
+    @instrumented
+    def save(self, output_path, format=None, **options):
         """
         Save the processed image.
         
         Args:
             output_path (str): Path to save the output image
+            format (str): Output format (inferred from the extension if omitted)
+            **options: Encoder options (compression, quality, bit_depth, strip),
+                see `_prepare_output`
         
         Returns:
             str: Path to the saved image
         """
         try:
+            format = format or os.path.splitext(output_path)[1].lstrip('.')
+            self._prepare_output(format, **options)
+            self.image.format = format
             self.image.save(filename=output_path)
             logger.info(f"Saved processed image to {output_path}")
             return output_path
@@ -218,6 +621,28 @@ class ImagePreprocessor:
             logger.error(f"Error saving image: {str(e)}")
             raise
     
+    @instrumented
+    def to_blob(self, format='png', **options):
+        """
+        Encode the processed image in memory.
+        
+        Args:
+            format (str): Output image format
+            **options: Encoder options (compression, quality, bit_depth, strip),
+                see `_prepare_output`
+        
+        Returns:
+            bytes: The encoded image
+        """
+        try:
+            self._prepare_output(format, **options)
+            blob = self.image.make_blob(format=format)
+            logger.info(f"Encoded processed image as {format} ({len(blob)} bytes)")
+            return blob
+        except Exception as e:
+            logger.error(f"Error encoding image: {str(e)}")
+            raise
+    
     def __del__(self):
         """Clean up resources when the object is destroyed."""
         if hasattr(self, 'image') and self.image:
@@ -0,0 +1,50 @@
+import os
+import math
+
+
+def cgroup_cpu_quota():
+    """
+    Return the CPU quota of this process's cgroup in cores, or None if unlimited.
+
+    Containers are often limited by a CFS quota rather than by CPU affinity,
+    so os.cpu_count() reports the host's cores instead of the usable ones.
+    """
+    # cgroup v2
+    try:
+        with open('/sys/fs/cgroup/cpu.max') as f:
+            quota, period = f.read().split()[:2]
+        if quota != 'max':
+            return int(quota) / int(period)
+        return None
+    except (OSError, ValueError):
+        pass
+
+    # cgroup v1
+    try:
+        with open('/sys/fs/cgroup/cpu/cpu.cfs_quota_us') as f:
+            quota = int(f.read())
+        with open('/sys/fs/cgroup/cpu/cpu.cfs_period_us') as f:
+            period = int(f.read())
+        if quota > 0 and period > 0:
+            return quota / period
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def available_cpus():
+    """Return the number of cores this process can use: its CPU affinity, capped by the cgroup quota."""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+
+    quota = cgroup_cpu_quota()
+    if quota:
+        cpus = min(cpus, max(1, math.ceil(quota)))
+    return cpus
+
+
+def split_cores(cores, processes):
+    """Return how many threads each of `processes` busy processes can run without oversubscribing `cores`."""
+    return max(1, cores // max(1, processes))
@@ -0,0 +1,184 @@
+import base64
+import io
+import json
+import os
+import tempfile
+import zipfile
+
+import pytest
+
+for module in ('flask', 'dotenv', 'wand', 'pdf2image', 'prometheus_client', 'numpy'):
+    pytest.importorskip(module)
+
+# Importing the app must not run jobs or write caches next to the code
+os.environ.setdefault('JOB_WORKERS', '0')
+os.environ.setdefault('JOBS_DIR', tempfile.mkdtemp())
+os.environ.setdefault('RESULT_CACHE_MAX_BYTES', '0')
+os.environ.setdefault('PAGE_CACHE_MAX_BYTES', '0')
+
+from werkzeug.datastructures import FileStorage
+
+import app
+from app import (BatchError, BatchTooLargeError, ZipStreamBuffer, format_event, page_event, page_windows,
+                 read_batch_items, stream_pages_zip)
+from pipeline import compile_pipeline
+
+
+@pytest.mark.parametrize('pages, window, runs', [
+    ([1, 2, 3, 4, 5], 2, [(1, 2), (3, 4), (5, 5)]),
+    ([1, 2, 3], 10, [(1, 3)]),
+    ([1, 2, 4, 5, 9], 10, [(1, 2), (4, 5), (9, 9)]),
+    ([3], 1, [(3, 3)]),
+    ([], 4, []),
+])
+def test_page_windows(pages, window, runs):
+    assert list(page_windows(pages, window)) == runs
+
+
+def test_iter_processed_pages_rejects_out_of_order_pages(tmp_path, monkeypatch):
+    def rasterized(*args, **kwargs):
+        # Page 1 went missing, so page 2 comes first
+        yield 2, str(tmp_path / 'page_2.ppm')
+
+    monkeypatch.setattr(app, 'get_page_executor', lambda: None)
+    monkeypatch.setattr(app, 'get_pdf_page_count', lambda pdf_path, pdf_hash=None: 2)
+    monkeypatch.setattr(app, 'iter_pdf_pages', rasterized)
+    monkeypatch.setattr(app, 'process_image', lambda *args: pytest.fail('page processed out of order'))
+
+    with pytest.raises(Exception, match='expected page 1, got 2'):
+        list(app.iter_processed_pages(str(tmp_path / 'scan.pdf'), str(tmp_path), compile_pipeline(['deskew'])))
+
+
+def test_zip_stream_buffer_drains_what_was_written():
+    buffer = ZipStreamBuffer()
+    buffer.write(b'abc')
+    buffer.write(memoryview(b'de'))
+
+    assert buffer.tell() == 5
+    assert buffer.drain() == b'abcde'
+    assert buffer.drain() == b''
+    # Offsets keep counting across drains, as zipfile relies on them
+    assert buffer.tell() == 5
+
+
+def test_stream_pages_zip_emits_each_page_as_it_is_ready(tmp_path):
+    paths = []
+    for page_number in (1, 2, 3):
+        path = tmp_path / f'processed_page_{page_number}.png'
+        path.write_bytes(f'page {page_number}'.encode())
+        paths.append(str(path))
+    consumed = []
+
+    def pages():
+        for page_number, path in enumerate(paths[1:], start=2):
+            consumed.append(page_number)
+            yield page_number, path, {'timings': {'total': 0.5}}
+
+    stream = stream_pages_zip(pages(), ready=[(1, paths[0], {'cached': True})])
+    first = next(stream)
+    # Page 1 is flushed before page 2 is taken from the generator
+    assert b'page_1.png' in first and consumed == []
+    archive = zipfile.ZipFile(io.BytesIO(first + b''.join(stream)))
+
+    assert archive.namelist() == ['page_1.png', 'page_2.png', 'page_3.png', 'timings.json']
+    assert archive.read('page_3.png') == b'page 3'
+    assert json.loads(archive.read('timings.json')) == [
+        {'cached': True, 'page': 1},
+        {'cached': False, 'total': 0.5, 'page': 2},
+        {'cached': False, 'total': 0.5, 'page': 3},
+    ]
+    assert not any(os.path.exists(path) for path in paths)
+
+
+def upload(name, data):
+    return FileStorage(stream=io.BytesIO(data), filename=name)
+
+
+def zip_upload(name, entries):
+    data = io.BytesIO()
+    with zipfile.ZipFile(data, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for entry, content in entries.items():
+            archive.writestr(entry, content)
+    return upload(name, data.getvalue())
+
+
+def test_read_batch_items_expands_zips_and_skips_metadata():
+    files = [
+        upload('a.png', b'aaa'),
+        upload('', b'ignored'),
+        zip_upload('scans.zip', {'b.jpg': b'bb', 'sub/c.jpg': b'c', '.hidden.jpg': b'x',
+                                 '__MACOSX/._b.jpg': b'x', 'sub/': b''}),
+    ]
+
+    assert read_batch_items(files) == [('a.png', b'aaa'), ('b.jpg', b'bb'), ('sub/c.jpg', b'c')]
+
+
+def test_read_batch_items_limits_the_item_count(monkeypatch):
+    monkeypatch.setattr(app, 'MAX_BATCH_ITEMS', 2)
+
+    assert len(read_batch_items([upload('a.png', b'a'), upload('b.png', b'b')])) == 2
+    with pytest.raises(BatchTooLargeError, match='exceeds 2 items'):
+        read_batch_items([upload('a.png', b'a'), zip_upload('more.zip', {'b.png': b'b', 'c.png': b'c'})])
+
+
+def test_read_batch_items_limits_the_input_bytes(monkeypatch):
+    monkeypatch.setattr(app, 'MAX_BATCH_BYTES', 5)
+
+    with pytest.raises(BatchTooLargeError, match='exceeds 5 bytes'):
+        read_batch_items([upload('a.png', b'aaa'), upload('b.png', b'bbb')])
+
+
+def test_read_batch_items_rejects_zip_bombs_before_decompressing(monkeypatch):
+    monkeypatch.setattr(app, 'MAX_BATCH_BYTES', 1024)
+    bomb = zip_upload('bomb.zip', {'zeros.png': bytes(1024 * 1024)})
+    read = []
+    monkeypatch.setattr(zipfile.ZipFile, 'read', lambda self, name: read.append(name))
+
+    with pytest.raises(BatchTooLargeError, match='exceeds 1024 bytes'):
+        read_batch_items([bomb])
+    assert read == []
+
+
+@pytest.mark.parametrize('files, message', [
+    ([], 'No images provided'),
+    ([upload('broken.zip', b'not a zip')], 'Invalid ZIP archive: broken.zip'),
+])
+def test_read_batch_items_rejects_empty_and_invalid_uploads(files, message):
+    with pytest.raises(BatchError, match=message):
+        read_batch_items(files)
+
+
+def test_format_event_writes_ndjson_or_sse():
+    event = {'page': 1, 'pages_total': 2}
+
+    assert format_event(event, 'ndjson') == '{"page": 1, "pages_total": 2}\n'
+    assert format_event(event, 'sse', name='done') == 'event: done\ndata: {"page": 1, "pages_total": 2}\n\n'
+
+
+def test_page_event_inlines_bytes_and_files(tmp_path):
+    details = {'deskew_angle': 1.5, 'width': 10, 'height': 20, 'timings': {'total': 0.25}}
+    path = tmp_path / 'processed_page_2.png'
+    path.write_bytes(b'from disk')
+
+    from_memory = page_event(1, 2, b'in memory', details, 'inline', 0.5, 'image/png')
+    from_disk = page_event(2, 2, str(path), details, 'inline', 0.75, 'image/png')
+
+    assert from_memory == {
+        'page': 1, 'pages_total': 2, 'cached': False, 'deskew_angle': 1.5, 'width': 10, 'height': 20,
+        'timings': {'total': 0.25, 'elapsed': 0.5}, 'image': base64.b64encode(b'in memory').decode('ascii'),
+        'mimetype': 'image/png',
+    }
+    assert base64.b64decode(from_disk['image']) == b'from disk'
+
+
+def test_page_event_links_cached_results():
+    details = {'cached': True, 'cache_key': 'abc123'}
+
+    with app.app.test_request_context():
+        event = page_event(1, 1, b'unused', details, 'url', 0.0, 'image/png')
+        inline = page_event(1, 1, b'data', {'cached': True}, 'url', 0.0, 'image/png')
+
+    assert event['url'] == '/api/results/abc123'
+    assert event['cached'] and 'image' not in event
+    # Without a cache entry there is nothing to link to, so the image is inlined
+    assert 'url' not in inline and inline['image'] == base64.b64encode(b'data').decode('ascii')
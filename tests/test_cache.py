@@ -0,0 +1,127 @@
+import os
+import time
+
+import pytest
+
+# cache keys include the Wand and ImageMagick versions
+pytest.importorskip('wand')
+pytest.importorskip('prometheus_client')
+
+import metrics
+from cache import DiskCache
+
+
+def age(cache, key, seconds, accessed_only=False):
+    """Move an entry's write time (and last use) `seconds` into the past."""
+    path = os.path.join(cache.directory, key)
+    stat = os.stat(path)
+    then = time.time() - seconds
+    os.utime(path, (then, stat.st_mtime if accessed_only else then))
+
+
+def test_get_returns_what_was_put(tmp_path):
+    cache = DiskCache(str(tmp_path), max_bytes=100, ttl=0)
+    cache.put('a', b'data')
+
+    assert cache.get('a') == b'data'
+    assert cache.get('b') is None
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_disabled_cache_stores_nothing(tmp_path):
+    cache = DiskCache(str(tmp_path / 'cache'), max_bytes=0, ttl=0)
+    cache.put('a', b'data')
+
+    assert not cache.enabled
+    assert cache.get('a') is None
+    assert not os.path.exists(cache.directory)
+
+
+def test_entries_larger_than_the_budget_are_not_stored(tmp_path):
+    cache = DiskCache(str(tmp_path), max_bytes=4, ttl=0)
+    cache.put('a', b'12345')
+
+    assert cache.get('a') is None
+
+
+def test_eviction_drops_least_recently_used_entries(tmp_path):
+    cache = DiskCache(str(tmp_path), max_bytes=10, ttl=0)
+    cache.put('a', b'aaaa')
+    cache.put('b', b'bbbb')
+    age(cache, 'a', 20)
+    age(cache, 'b', 10)
+    # Using 'a' makes 'b' the least recently used entry
+    assert cache.get('a') == b'aaaa'
+
+    cache.put('c', b'cccc')
+
+    assert cache.get('b') is None
+    assert cache.get('a') == b'aaaa'
+    assert cache.get('c') == b'cccc'
+    assert cache.stats()['bytes'] == 8
+
+
+def test_expired_entries_are_misses_even_when_recently_used(tmp_path):
+    cache = DiskCache(str(tmp_path), max_bytes=100, ttl=60)
+    cache.put('a', b'data')
+    age(cache, 'a', 120)
+    # Reading does not extend the lifetime of an entry
+    age(cache, 'a', 0, accessed_only=True)
+
+    assert cache.get('a') is None
+    assert not os.path.exists(os.path.join(cache.directory, 'a'))
+
+
+def test_eviction_removes_expired_entries(tmp_path):
+    # Under budget, expired entries are only removed by the periodic scan
+    cache = DiskCache(str(tmp_path), max_bytes=100, ttl=60, scan_interval=0)
+    cache.put('old', b'data')
+    age(cache, 'old', 120)
+
+    cache.put('new', b'data')
+
+    assert cache.stats()['entries'] == 1
+    assert cache.get('new') == b'data'
+
+
+def test_puts_under_budget_do_not_rescan_the_directory(tmp_path, monkeypatch):
+    cache = DiskCache(str(tmp_path), max_bytes=10, ttl=0)
+    scans = []
+    entries = cache._entries
+    monkeypatch.setattr(cache, '_entries', lambda: scans.append(1) or entries())
+
+    cache.put('a', b'aaaa')
+    cache.put('b', b'bbbb')
+    assert len(scans) == 1
+
+    # Crossing the budget scans and evicts
+    cache.put('c', b'cccc')
+    assert len(scans) == 2
+    assert cache.stats()['bytes'] == 8
+
+
+def test_lookups_are_exported_as_metrics(tmp_path):
+    cache = DiskCache(str(tmp_path), max_bytes=100, ttl=0, name='test')
+    cache.put('a', b'data')
+
+    def count(result):
+        return metrics.CACHE_LOOKUPS.labels(cache='test', result=result)._value.get()
+
+    hits, misses = count('hit'), count('miss')
+    cache.get('a')
+    cache.get('b')
+    cache.get('c')
+
+    assert (count('hit') - hits, count('miss') - misses) == (1, 2)
+
+
+def test_get_file_links_the_entry(tmp_path):
+    cache = DiskCache(str(tmp_path / 'cache'), max_bytes=100, ttl=0)
+    source = tmp_path / 'page.ppm'
+    source.write_bytes(b'P6 pixels')
+    cache.put_file('page', str(source))
+
+    output = tmp_path / 'out.ppm'
+    assert cache.get_file('page', str(output))
+    assert output.read_bytes() == b'P6 pixels'
+    assert not cache.get_file('missing', str(tmp_path / 'missing.ppm'))
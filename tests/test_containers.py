@@ -0,0 +1,47 @@
+import re
+import zlib
+
+import pytest
+
+Image = pytest.importorskip('PIL.Image')
+
+from containers import PdfWriter
+
+
+def image_stream(pdf):
+    """Return (bits per component, decompressed pixels) of the first image in a PDF."""
+    match = re.search(rb'/BitsPerComponent (\d+) /Filter /FlateDecode /Length (\d+) >>\nstream\n', pdf)
+    assert match, 'no deflated image in the PDF'
+    length = int(match.group(2))
+    return int(match.group(1)), zlib.decompress(pdf[match.end():match.end() + length])
+
+
+def write_pdf(path):
+    writer = PdfWriter(dpi=300)
+    return writer.start() + writer.add_page(str(path)) + writer.finish()
+
+
+def test_pdf_keeps_16_bit_gray_pages(tmp_path):
+    values = [0, 257, 32768, 65535]
+    path = tmp_path / 'page.png'
+    page = Image.new('I', (len(values), 1))
+    page.putdata(values)
+    page.save(path)
+
+    bits, pixels = image_stream(write_pdf(path))
+
+    assert bits == 16
+    assert pixels == b''.join(value.to_bytes(2, 'big') for value in values)
+
+
+def test_pdf_keeps_8_bit_gray_pages(tmp_path):
+    values = [0, 64, 128, 255]
+    path = tmp_path / 'page.png'
+    page = Image.new('L', (len(values), 1))
+    page.putdata(values)
+    page.save(path)
+
+    bits, pixels = image_stream(write_pdf(path))
+
+    assert bits == 8
+    assert pixels == bytes(values)
@@ -0,0 +1,94 @@
+import time
+from contextlib import closing
+
+import pytest
+
+from jobs import COMPLETED, FAILED, QUEUED, RUNNING, JobStore
+from pipeline import compile_pipeline
+
+
+@pytest.fixture
+def store(tmp_path):
+    return JobStore(str(tmp_path / 'jobs.db'), stale_after=60, max_attempts=2)
+
+
+def create_job(store, name='scan.pdf'):
+    return store.create(name, f'/uploads/{name}', compile_pipeline(['deskew']))
+
+
+def expire_heartbeat(store, job_id):
+    """Make a running job look as if its worker died a while ago."""
+    with closing(store._connect()) as conn:
+        conn.execute('UPDATE jobs SET heartbeat_at = ? WHERE id = ?',
+                     (time.time() - store.stale_after - 1, job_id))
+
+
+def test_create_queues_the_job_with_its_plan(store):
+    job_id = create_job(store)
+    job = store.get(job_id)
+
+    assert job['status'] == QUEUED
+    assert job['attempts'] == 0
+    assert '"step": "deskew"' in job['plan']
+    assert store.get('missing') is None
+
+
+def test_claim_takes_the_oldest_queued_job_once(store):
+    first = create_job(store, 'first.pdf')
+    second = create_job(store, 'second.pdf')
+
+    claimed = store.claim()
+    assert (claimed['id'], claimed['status']) == (first, RUNNING)
+    assert store.get(first)['attempts'] == 1
+    assert store.claim()['id'] == second
+    assert store.claim() is None
+
+
+def test_claim_skips_running_jobs_with_a_fresh_heartbeat(store):
+    job_id = create_job(store)
+    store.claim()
+    store.heartbeat(job_id)
+
+    assert store.claim() is None
+
+
+def test_claim_reclaims_stale_running_jobs(store):
+    job_id = create_job(store)
+    store.claim()
+    store.update_progress(job_id, 3, 10)
+    expire_heartbeat(store, job_id)
+
+    reclaimed = store.claim()
+
+    assert reclaimed['id'] == job_id
+    job = store.get(job_id)
+    assert (job['status'], job['attempts'], job['pages_done']) == (RUNNING, 2, 0)
+
+
+def test_claim_fails_jobs_interrupted_max_attempts_times(store):
+    job_id = create_job(store)
+    for _ in range(store.max_attempts):
+        assert store.claim()['id'] == job_id
+        expire_heartbeat(store, job_id)
+    other = create_job(store, 'other.pdf')
+
+    # The exhausted job is failed and the next one handed out instead
+    assert store.claim()['id'] == other
+    job = store.get(job_id)
+    assert job['status'] == FAILED
+    assert job['error'] == 'Job was interrupted too many times'
+
+
+def test_finished_jobs_are_not_claimed_and_get_purged(store):
+    done = create_job(store, 'done.pdf')
+    failed = create_job(store, 'failed.pdf')
+    store.claim()
+    store.claim()
+    store.complete(done, '/results/done.zip', 'application/zip', 'processed_images.zip')
+    store.fail(failed, 'Error converting PDF to images')
+
+    assert store.claim() is None
+    assert store.get(done)['status'] == COMPLETED
+    assert store.purge(older_than=60) == []
+    assert sorted(store.purge(older_than=-1)) == ['/uploads/done.pdf', '/uploads/failed.pdf']
+    assert store.get(done) is None
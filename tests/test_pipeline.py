@@ -0,0 +1,193 @@
+import pytest
+
+from pipeline import (PRESETS, STEPS, Param, PipelineError, Plan, Step, compile_pipeline, parse_output,
+                      parse_params, plan_colorspace)
+
+
+def test_param_converts_form_strings():
+    param = Param('denoise_level', 'level', int, 1, min_value=1, max_value=3)
+
+    assert param.parse('2') == 2
+
+
+@pytest.mark.parametrize('value, message', [
+    ('abc', "Invalid value for 'denoise_level': expected int, got 'abc'"),
+    (True, "Invalid value for 'denoise_level': True"),
+    (0, "'denoise_level' must be >= 1, got 0"),
+    (4, "'denoise_level' must be <= 3, got 4"),
+])
+def test_param_rejects_invalid_values(value, message):
+    param = Param('denoise_level', 'level', int, 1, min_value=1, max_value=3)
+
+    with pytest.raises(PipelineError) as error:
+        param.parse(value)
+    assert str(error.value) == message
+
+
+@pytest.mark.parametrize('value', ['nan', 'inf', '-inf', float('nan'), float('inf')])
+def test_float_params_reject_non_finite_values(value):
+    param = STEPS['deskew'].params[0]
+
+    with pytest.raises(PipelineError, match="'deskew_max_angle' must be a finite number"):
+        param.parse(value)
+
+
+@pytest.mark.parametrize('value', [2.9, float('nan'), float('inf'), 'nan', '2.5'])
+def test_int_params_reject_non_integral_values(value):
+    param = Param('denoise_level', 'level', int, 1, min_value=1, max_value=3)
+
+    with pytest.raises(PipelineError, match="Invalid value for 'denoise_level': expected int"):
+        param.parse(value)
+
+
+def test_int_params_accept_integral_floats():
+    param = Param('denoise_level', 'level', int, 1, min_value=1, max_value=3)
+
+    assert param.parse(2.0) == 2
+
+
+def test_params_json_rejects_nan():
+    with pytest.raises(PipelineError, match='must be a finite number'):
+        compile_pipeline(['enhance'], parse_params('{"enhance_factor": NaN}'))
+
+
+def test_param_rejects_unknown_choices():
+    param = STEPS['binarize'].params[0]
+
+    assert param.parse('otsu') == 'otsu'
+    with pytest.raises(PipelineError, match="must be one of fixed, otsu, sauvola, got 'median'"):
+        param.parse('median')
+
+
+def test_compile_pipeline_uses_defaults_and_params():
+    plan = compile_pipeline(['denoise', 'binarize'], {'denoise_level': '3', 'binarize_method': 'sauvola'})
+
+    assert plan.steps == ['denoise', 'binarize']
+    assert plan.calls[0] == ('denoise', 'denoise', {'level': 3})
+    assert plan.calls[1][2] == {'method': 'sauvola', 'threshold': 128, 'window': 25, 'k': 0.2}
+
+
+def test_compile_pipeline_defaults_to_the_default_steps():
+    assert compile_pipeline().steps == ['deskew', 'denoise', 'binarize', 'enhance']
+
+
+def test_compile_pipeline_rejects_unknown_steps():
+    with pytest.raises(PipelineError, match=r'^Unknown step\(s\): blur\. Available steps: '):
+        compile_pipeline(['deskew', 'blur'])
+
+
+def test_compile_pipeline_rejects_unknown_params():
+    with pytest.raises(PipelineError, match=r'^Unknown parameter\(s\): blur_radius, zoom$'):
+        compile_pipeline(['deskew'], {'zoom': 2, 'blur_radius': 1})
+
+
+def test_parse_params_rejects_invalid_json():
+    assert parse_params('') == {}
+    with pytest.raises(PipelineError, match='^Invalid params JSON'):
+        parse_params('{')
+    with pytest.raises(PipelineError, match='must be a JSON object'):
+        parse_params('[1, 2]')
+
+
+def test_presets_map_form_fields_and_defaults():
+    binarize = PRESETS['binarize'].compile({'method': 'otsu', 'threshold': '', 'k': '0.5'})
+    google_vision = PRESETS['google_vision'].compile({'denoise_level': '2'})
+
+    assert binarize.calls[0][2] == {'method': 'otsu', 'threshold': 128, 'window': 25, 'k': 0.5}
+    assert google_vision.steps == ['deskew', 'enhance', 'denoise']
+    assert google_vision.calls[1][2] == {'factor': 1.5}
+    assert google_vision.calls[2][2] == {'level': 2}
+
+
+def test_preset_rejects_invalid_form_values():
+    with pytest.raises(PipelineError, match="'enhance_factor' must be >= 0"):
+        PRESETS['enhance'].compile({'factor': '-1'})
+
+
+@pytest.mark.parametrize('steps, colorspace', [
+    (['deskew', 'denoise', 'binarize', 'enhance'], 'gray'),
+    (['binarize'], 'gray'),
+    (['deskew', 'enhance', 'denoise'], 'rgb'),
+    ([], 'rgb'),
+])
+def test_plan_colorspace(steps, colorspace):
+    assert plan_colorspace(steps) == colorspace
+
+
+def test_color_steps_before_binarize_keep_color(monkeypatch):
+    monkeypatch.setitem(STEPS, 'colorize', Step('colorize', 'colorize'))
+
+    assert plan_colorspace(['colorize', 'binarize']) == 'rgb'
+    # Color is only discarded afterwards, so it does not matter after binarize
+    assert plan_colorspace(['binarize', 'colorize']) == 'gray'
+
+
+def test_presets_plan_colorspace():
+    assert PRESETS['default'].compile({}).colorspace == 'gray'
+    assert PRESETS['google_vision'].compile({}).colorspace == 'rgb'
+
+
+def test_parse_output_defaults():
+    output = parse_output({})
+
+    assert output.to_dict() == {'format': 'png', 'compression': None, 'quality': 90, 'bit_depth': None,
+                                'strip': False, 'container': 'zip'}
+
+
+def test_parse_output_tiff_container_defaults_to_tiff_pages():
+    output = parse_output({'output_container': 'TIFF', 'output_strip': 'yes'})
+
+    assert (output.format, output.container, output.strip) == ('tiff', 'tiff', True)
+    assert output.container_mimetype == 'image/tiff'
+
+
+@pytest.mark.parametrize('form, encoder_args, extension, mimetype', [
+    ({'output_format': 'PNG', 'output_compression': '9'},
+     {'format': 'png', 'compression': 9, 'quality': 90, 'bit_depth': None, 'strip': False}, 'png', 'image/png'),
+    ({'output_format': 'jpeg', 'output_quality': '75', 'output_strip': 'on'},
+     {'format': 'jpeg', 'compression': None, 'quality': 75, 'bit_depth': None, 'strip': True}, 'jpg', 'image/jpeg'),
+    ({'output_format': 'tiff', 'output_bit_depth': '16', 'output_compression': ''},
+     {'format': 'tiff', 'compression': None, 'quality': 90, 'bit_depth': 16, 'strip': False}, 'tif', 'image/tiff'),
+    ({'output_format': 'webp', 'output_compression': '0', 'output_strip': 'no'},
+     {'format': 'webp', 'compression': 0, 'quality': 90, 'bit_depth': None, 'strip': False}, 'webp', 'image/webp'),
+])
+def test_parse_output_maps_form_fields_to_encoder_args(form, encoder_args, extension, mimetype):
+    output = parse_output(form)
+
+    assert output.encoder_args() == encoder_args
+    assert (output.extension, output.mimetype) == (extension, mimetype)
+
+
+def test_parse_output_pdf_container():
+    output = parse_output({'output_container': 'pdf', 'output_format': 'jpeg'})
+
+    assert (output.container_name, output.container_mimetype) == ('processed_pages.pdf', 'application/pdf')
+
+
+@pytest.mark.parametrize('form, message', [
+    ({'output_format': 'gif'}, '^Unknown output format: gif'),
+    ({'output_container': 'rar'}, '^Unknown output container: rar'),
+    ({'output_container': 'tiff', 'output_format': 'png'}, 'requires output_format=tiff'),
+    ({'output_format': 'jpeg', 'output_bit_depth': '16'}, "only supports a bit depth of 8"),
+    ({'output_bit_depth': '12'}, "'output_bit_depth' must be 8 or 16, got 12"),
+    ({'output_compression': '10'}, "'output_compression' must be <= 9, got 10"),
+])
+def test_parse_output_rejects_invalid_options(form, message):
+    with pytest.raises(PipelineError, match=message):
+        parse_output(form)
+
+
+def test_plan_round_trips_through_dict():
+    plan = compile_pipeline(['deskew', 'binarize'], {'deskew_max_angle': 5},
+                            output=parse_output({'output_format': 'webp', 'output_compression': '3'}))
+
+    restored = Plan.from_dict(plan.to_dict())
+
+    assert restored.calls == plan.calls
+    assert restored.colorspace == 'gray'
+    assert restored.output.to_dict() == plan.output.to_dict()
+
+
+def test_plan_from_dict_rejects_unregistered_steps():
+    with pytest.raises(PipelineError, match='^Unknown step: blur$'):
+        Plan.from_dict({'steps': [{'step': 'blur', 'params': {}}]})
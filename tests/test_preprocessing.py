@@ -0,0 +1,48 @@
+import struct
+
+import pytest
+
+pytest.importorskip('numpy')
+wand_image = pytest.importorskip('wand.image')
+
+from preprocessing import ImagePreprocessor
+
+
+def gray_page(values):
+    """A one-row 8-bit grayscale image with the given pixel values."""
+    header = f'P5 {len(values)} 1 255\n'.encode('ascii')
+    return ImagePreprocessor.from_blob(header + bytes(values))
+
+
+def png_header(blob):
+    """Return (bit depth, color type) from a PNG's IHDR chunk."""
+    assert blob.startswith(b'\x89PNG\r\n\x1a\n')
+    return struct.unpack('>BB', blob[24:26])
+
+
+def tiff_compression(blob):
+    with wand_image.Image(blob=blob) as image:
+        return image.compression
+
+
+def test_bilevel_images_are_written_as_1_bit_png():
+    assert png_header(gray_page([0, 255, 255, 0]).to_blob('png')) == (1, 0)
+
+
+def test_bilevel_images_are_written_as_group4_tiff():
+    assert tiff_compression(gray_page([0, 255, 255, 0]).to_blob('tiff')) == 'group4'
+
+
+def test_requested_bit_depth_overrides_bilevel_output():
+    assert png_header(gray_page([0, 255, 255, 0]).to_blob('png', bit_depth=8)) == (8, 0)
+
+
+def test_gray_images_keep_their_depth():
+    assert png_header(gray_page([0, 128, 255, 64]).to_blob('png'))[0] == 8
+
+
+@pytest.mark.parametrize('compression, expected', [(None, 'lzw'), (0, 'no'), (6, 'zip')])
+def test_tiff_compression_levels(compression, expected):
+    blob = gray_page([0, 128, 255, 64]).to_blob('tiff', compression=compression)
+
+    assert tiff_compression(blob) == expected
@@ -0,0 +1,29 @@
+import pytest
+
+import scheduling
+from scheduling import available_cpus, split_cores
+
+
+@pytest.mark.parametrize('cores, processes, threads', [
+    (8, 1, 8),
+    (8, 2, 4),
+    (8, 3, 2),
+    (8, 16, 1),
+    (1, 4, 1),
+    (4, 0, 4),
+])
+def test_split_cores(cores, processes, threads):
+    assert split_cores(cores, processes) == threads
+
+
+def test_available_cpus_is_capped_by_the_cgroup_quota(monkeypatch):
+    monkeypatch.setattr(scheduling.os, 'sched_getaffinity', lambda pid: set(range(16)), raising=False)
+
+    monkeypatch.setattr(scheduling, 'cgroup_cpu_quota', lambda: 2.5)
+    assert available_cpus() == 3
+
+    monkeypatch.setattr(scheduling, 'cgroup_cpu_quota', lambda: 0.5)
+    assert available_cpus() == 1
+
+    monkeypatch.setattr(scheduling, 'cgroup_cpu_quota', lambda: None)
+    assert available_cpus() == 16
@@ -0,0 +1,92 @@
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from thresholds import otsu_threshold, sauvola_thresholds
+
+
+def reference_otsu(gray):
+    """Otsu's threshold by brute force over every candidate, in float64."""
+    values = gray.ravel().astype(np.float64)
+    best, best_variance = 0, -1.0
+    for threshold in range(256):
+        below, above = values[values <= threshold], values[values > threshold]
+        if not len(below) or not len(above):
+            continue
+        variance = len(below) * len(above) * (below.mean() - above.mean()) ** 2
+        if variance > best_variance:
+            best, best_variance = threshold, variance
+    return best
+
+
+def reference_sauvola(gray, window, k, dynamic_range=128):
+    """Sauvola thresholds from float64 integral images, which never wrap."""
+    half, area = window // 2, window * window
+    padded = np.pad(gray.astype(np.float64), half, mode='edge')
+
+    def window_sums(values):
+        integral = np.zeros((values.shape[0] + 1, values.shape[1] + 1))
+        integral[1:, 1:] = values.cumsum(axis=0).cumsum(axis=1)
+        return (integral[window:, window:] - integral[:-window, window:]
+                - integral[window:, :-window] + integral[:-window, :-window])
+
+    mean = window_sums(padded) / area
+    std = np.sqrt(np.maximum(window_sums(padded * padded) / area - mean * mean, 0))
+    return mean * (1 + k * (std / dynamic_range - 1))
+
+
+def test_otsu_separates_a_bimodal_histogram():
+    rng = np.random.default_rng(0)
+    dark = rng.normal(60, 12, 4000)
+    light = rng.normal(190, 15, 6000)
+    gray = np.clip(np.concatenate([dark, light]), 0, 255).astype(np.uint8).reshape(100, 100)
+
+    threshold = otsu_threshold(gray)
+
+    assert threshold == reference_otsu(gray)
+    assert 90 < threshold < 160
+
+
+def test_otsu_of_a_uniform_image_is_defined():
+    assert otsu_threshold(np.full((4, 4), 200, dtype=np.uint8)) == 0
+
+
+def test_sauvola_matches_a_sliding_window_reference():
+    rng = np.random.default_rng(1)
+    gray = rng.integers(0, 256, (30, 40), dtype=np.uint8)
+    window = 7
+    windows = np.lib.stride_tricks.sliding_window_view(
+        np.pad(gray.astype(np.float64), window // 2, mode='edge'), (window, window))
+    mean, std = windows.mean(axis=(2, 3)), windows.std(axis=(2, 3))
+    expected = mean * (1 + 0.3 * (std / 128 - 1))
+
+    thresholds = sauvola_thresholds(gray, window=window, k=0.3)
+
+    assert thresholds.shape == gray.shape
+    np.testing.assert_allclose(thresholds, expected, atol=0.1)
+
+
+def test_sauvola_is_exact_at_the_largest_window_on_a_white_page():
+    # Every window's sum of squares is 255**4, just under 2**32, and the
+    # integral images wrap around several times
+    gray = np.full((300, 300), 255, dtype=np.uint8)
+
+    thresholds = sauvola_thresholds(gray, window=255, k=0.2)
+
+    np.testing.assert_allclose(thresholds, 255 * (1 - 0.2), atol=0.1)
+
+
+def test_sauvola_at_the_largest_window_on_a_random_page():
+    rng = np.random.default_rng(2)
+    # Bright pages make the integral of squares wrap around 2**32
+    gray = rng.integers(180, 256, (120, 90), dtype=np.uint8)
+
+    thresholds = sauvola_thresholds(gray, window=255, k=0.2)
+
+    np.testing.assert_allclose(thresholds, reference_sauvola(gray, 255, 0.2), atol=0.1)
+
+
+def test_sauvola_rounds_even_windows_up_to_odd():
+    gray = np.random.default_rng(3).integers(0, 256, (20, 20), dtype=np.uint8)
+
+    np.testing.assert_allclose(sauvola_thresholds(gray, window=8), reference_sauvola(gray, 9, 0.2), atol=0.1)
@@ -0,0 +1,77 @@
+"""
+Global and local binarization thresholds for 8-bit grayscale pixels, computed with NumPy.
+"""
+import numpy as np
+
+
+def otsu_threshold(gray):
+    """
+    Compute the global threshold that maximizes the between-class variance
+    of an 8-bit grayscale image's histogram (Otsu's method).
+
+    Returns:
+        int: Threshold (0-255); pixels above it become white
+    """
+    histogram = np.bincount(gray.ravel(), minlength=256).astype(np.float64)
+    levels = np.arange(256, dtype=np.float64)
+    weight = np.cumsum(histogram)
+    mass = np.cumsum(histogram * levels)
+    total_weight, total_mass = weight[-1], mass[-1]
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean_below = mass / weight
+        mean_above = (total_mass - mass) / (total_weight - weight)
+        variance = weight * (total_weight - weight) * (mean_below - mean_above) ** 2
+    return int(np.argmax(np.nan_to_num(variance)))
+
+
+def sauvola_thresholds(gray, window=25, k=0.2, dynamic_range=128):
+    """
+    Compute a Sauvola threshold for every pixel of an 8-bit grayscale image:
+    mean * (1 + k * (std / dynamic_range - 1)) over a window x window neighbourhood.
+
+    Local means and deviations come from integral images of the values and
+    their squares, so the cost does not depend on the window size. The
+    integral images are uint32 and may wrap around: differences of wrapped
+    sums are still exact while a window's sum fits in 32 bits, which holds
+    for windows up to 255 pixels. Everything else is float32 and computed
+    in place, so a page needs a few 4-byte arrays of its size at most.
+
+    Returns:
+        numpy.ndarray: float32 thresholds with the image's shape
+    """
+    window = window | 1
+    half = window // 2
+    area = window * window
+
+    def window_sums(values):
+        integral = np.zeros((values.shape[0] + 1, values.shape[1] + 1), dtype=np.uint32)
+        np.cumsum(values, axis=0, dtype=np.uint32, out=integral[1:, 1:])
+        np.cumsum(integral[1:, 1:], axis=1, dtype=np.uint32, out=integral[1:, 1:])
+        sums = integral[window:, window:] - integral[:-window, window:]
+        sums -= integral[window:, :-window]
+        sums += integral[:-window, :-window]
+        return sums
+
+    values = np.pad(gray, half, mode='edge').astype(np.uint32)
+    sums = window_sums(values)
+    values *= values
+    square_sums = window_sums(values)
+    del values
+
+    mean = sums.astype(np.float32)
+    del sums
+    mean /= area
+    # The variance buffer becomes the deviation, then the threshold
+    thresholds = square_sums.astype(np.float32)
+    del square_sums
+    thresholds /= area
+    thresholds -= mean * mean
+    np.maximum(thresholds, 0, out=thresholds)
+    np.sqrt(thresholds, out=thresholds)
+    thresholds /= dynamic_range
+    thresholds -= 1
+    thresholds *= k
+    thresholds += 1
+    thresholds *= mean
+    return thresholds